@@ -0,0 +1,513 @@
+# Github-Repo-Backuper
+# Copyright (C) 2024  Jan9103
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Offline benchmark for github-repo-backuper.py.
+
+Starts a local stand-in for the github api (in a separate process) with synthetic repos,
+backs each of them up twice (full + incremental after some issues got updated),
+and reports time, requests, requests/sec, rate-limit usage and peak memory.
+Nothing gets sent to github and no rate-limit is used.
+
+Examples:
+    python3 github-repo-backuper-benchmark.py --sizes 100,1000 --jobs 8
+    python3 github-repo-backuper-benchmark.py --json new.json --compare old.json
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import tracemalloc
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+from types import ModuleType
+from typing import Optional, List, Dict, Any, Tuple
+from time import sleep, time, perf_counter, strftime, gmtime
+from urllib.parse import urlparse, parse_qs
+from os import path
+from sys import exit
+
+
+GITHUB_API_URL: str = "https://api.github.com"
+OWNER: str = "bench"
+CREATED_AT: str = "2024-01-01T00:00:00Z"
+BODY: str = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+REACTIONS: Dict[str, Any] = {
+    "url": "", "total_count": 3, "+1": 2, "-1": 0, "laugh": 0, "hooray": 0, "confused": 0, "heart": 1, "rocket": 0, "eyes": 0,
+}
+
+
+def _timestamp(t: float) -> str:
+    return strftime("%Y-%m-%dT%H:%M:%SZ", gmtime(t))
+
+
+class SyntheticRepo:
+    """deterministic issues, comments, releases, and projects of a given size"""
+
+    def __init__(self, base_url: str, name: str, issues: int, comments: int, releases: int, asset_size: int) -> None:
+        self.base_url: str = base_url
+        self.name: str = name
+        self.issue_count: int = issues
+        self.average_comments: int = comments
+        self.release_count: int = releases
+        self.asset: bytes = (hashlib.sha256(name.encode()).digest() * (asset_size // 32 + 1))[:asset_size]
+        self.asset_digest: str = f"sha256:{hashlib.sha256(self.asset).hexdigest()}"
+        # number -> update time (issues changed since the start of the server)
+        self.touched: Dict[int, str] = {}
+        # generated listings (every page request would otherwise generate the whole list) -> cleared by touch()
+        self._listings: Dict[Tuple[str, Optional[str]], List[Dict[str, Any]]] = {}
+
+    def touch(self, fraction: float, updated_at: str) -> None:
+        if fraction > 0:
+            for number in range(1, self.issue_count + 1, max(int(1 / fraction), 1)):
+                self.touched[number] = updated_at
+        self._listings = {}
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/repos/{OWNER}/{self.name}"
+
+    def comment_count(self, number: int) -> int:
+        return number % (self.average_comments * 2 + 1) + (1 if number in self.touched else 0)
+
+    def issue(self, number: int) -> Dict[str, Any]:
+        issue: Dict[str, Any] = {
+            "url": f"{self.api_url}/issues/{number}",
+            "comments_url": f"{self.api_url}/issues/{number}/comments",
+            "id": number * 7,
+            "number": number,
+            "title": f"Synthetic issue {number}",
+            "user": {"login": f"user{number % 17}", "id": number % 17},
+            "labels": [{"id": 1, "name": "bug", "color": "ff0000"}] if number % 3 == 0 else [],
+            "state": "closed" if number % 4 == 0 else "open",
+            "locked": False,
+            "assignees": [],
+            "comments": self.comment_count(number),
+            "created_at": CREATED_AT,
+            "updated_at": self.touched.get(number, CREATED_AT),
+            "closed_at": CREATED_AT if number % 4 == 0 else None,
+            "author_association": "NONE",
+            "active_lock_reason": None,
+            "body": BODY,
+            "reactions": REACTIONS,
+        }
+        if number % 2 == 0:
+            issue["draft"] = False
+            issue["pull_request"] = {"url": f"{self.api_url}/pulls/{number}", "merged_at": None}
+        return issue
+
+    def issues(self, since: Optional[str]) -> List[Dict[str, Any]]:
+        if ("issues", since) not in self._listings:
+            numbers = range(self.issue_count, 0, -1)  # newest first (like github)
+            if since is not None:
+                numbers = [n for n in numbers if self.touched.get(n, CREATED_AT) >= since]
+            self._listings["issues", since] = [self.issue(n) for n in numbers]
+        return self._listings["issues", since]
+
+    def comments(self, number: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": number * 1000 + i,
+                "issue_url": f"{self.api_url}/issues/{number}",
+                "user": {"login": f"user{i % 17}", "id": i % 17},
+                "created_at": CREATED_AT if i < number % (self.average_comments * 2 + 1) else self.touched[number],
+                "updated_at": CREATED_AT if i < number % (self.average_comments * 2 + 1) else self.touched[number],
+                "author_association": "NONE",
+                "body": BODY[:200],
+                "reactions": REACTIONS,
+            }
+            for i in range(self.comment_count(number))
+        ]
+
+    def all_comments(self, since: Optional[str]) -> List[Dict[str, Any]]:
+        if ("comments", since) not in self._listings:
+            comments: List[Dict[str, Any]] = [c for n in range(1, self.issue_count + 1) for c in self.comments(n)]
+            if since is not None:
+                comments = [c for c in comments if c["updated_at"] >= since]
+            self._listings["comments", since] = sorted(comments, key=lambda c: c["created_at"])
+        return self._listings["comments", since]
+
+    def pull(self, number: int) -> Dict[str, Any]:
+        return {
+            "number": number,
+            "merge_commit_sha": hashlib.sha1(str(number).encode()).hexdigest(),
+            "requested_reviewers": [],
+            "head": {"ref": f"feature-{number}", "repo": {"full_name": f"user{number % 17}/{self.name}"}},
+            "base": {"ref": "main"},
+            "merged": False,
+            "merged_by": None,
+        }
+
+    def releases(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": i,
+                "tag_name": f"v{i}.0",
+                "name": f"Release {i}",
+                "body": BODY,
+                "draft": False,
+                "prerelease": False,
+                "created_at": CREATED_AT,
+                "published_at": CREATED_AT,
+                "author": {"login": "user0"},
+                "assets": [{
+                    "id": i,
+                    "name": f"{self.name}-{i}.bin",
+                    "content_type": "application/x-binary",
+                    "size": len(self.asset),
+                    "digest": self.asset_digest,
+                    "browser_download_url": f"{self.base_url}/assets/{self.name}/{i}",
+                }],
+            }
+            for i in range(self.release_count, 0, -1)
+        ]
+
+    def projects(self) -> List[Dict[str, Any]]:
+        return [{
+            "id": 1,
+            "name": "Roadmap",
+            "body": BODY[:100],
+            "state": "open",
+            "columns_url": f"{self.base_url}/projects/{self.name}/1/columns",
+        }]
+
+    def columns(self) -> List[Dict[str, Any]]:
+        return [{"id": i, "name": f"column {i}", "cards_url": f"{self.base_url}/projects/columns/{self.name}/{i}/cards"} for i in range(3)]
+
+    def cards(self, column: int) -> List[Dict[str, Any]]:
+        return [
+            {"id": column * 100 + i, "note": f"card {i}", "archived": False, "created_at": CREATED_AT, "updated_at": CREATED_AT, "creator": {"login": "user0"}}
+            for i in range(5)
+        ]
+
+
+class MockGithub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, config: Dict[str, Any]) -> None:
+        super().__init__(("127.0.0.1", port), MockGithubHandler)
+        self.base_url: str = f"http://127.0.0.1:{self.server_address[1]}"
+        self.latency: float = config["latency"]
+        self.item_latency: float = config["item_latency"]
+        self.rate_limit: int = config["rate_limit"]
+        self.lock: threading.Lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.rate_limit_used: int = 0
+        self.rate_limit_reset: int = int(time()) + 3600
+        self.repos: Dict[str, SyntheticRepo] = {
+            f"size-{size}": SyntheticRepo(self.base_url, f"size-{size}", size, config["comments"], config["releases"], config["asset_size"])
+            for size in config["sizes"]
+        }
+
+
+class MockGithubHandler(BaseHTTPRequestHandler):
+    """the subset of the github rest api used by github-repo-backuper.py (+ /_bench/ control endpoints)"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately -> 40ms delayed-ack stalls otherwise
+    server: MockGithub
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        body: Dict[str, Any] = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if url.path == "/_bench/touch":
+            repo: SyntheticRepo = self.server.repos[body["repo"]]
+            updated_at: str = _timestamp(time() + 1)  # +1: always newer than the start of the last backup
+            with self.server.lock:
+                repo.touch(body["fraction"], updated_at)
+            return self._send_json(200, {"touched": len(repo.touched)}, count=False)
+        if url.path == "/_bench/reset":
+            with self.server.lock:
+                stats = {"requests": self.server.requests, "rate_limit_used": self.server.rate_limit_used}
+                self.server.requests = {}
+                self.server.rate_limit_used = 0
+                self.server.rate_limit_reset = int(time()) + 3600
+            return self._send_json(200, stats, count=False)
+        self._send_json(404, {"message": "Not Found"})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query: Dict[str, List[str]] = parse_qs(url.query)
+        parts: List[str] = url.path.strip("/").split("/")
+        since: Optional[str] = query.get("since", [None])[0]
+        repo: Optional[SyntheticRepo] = None
+        if len(parts) >= 3 and parts[0] == "repos" and parts[1] == OWNER:
+            repo = self.server.repos.get(parts[2])
+        elif len(parts) >= 3 and parts[0] in ("assets", "projects"):
+            repo = self.server.repos.get(parts[2] if parts[1] == "columns" else parts[1])
+
+        if parts == ["users", OWNER, "repos"]:
+            return self._send_page("repos", [
+                {"name": name, "full_name": f"{OWNER}/{name}", "fork": False, "pushed_at": CREATED_AT, "updated_at": CREATED_AT}
+                for name in self.server.repos
+            ], query)
+        if repo is None:
+            return self._send_json(404, {"message": "Not Found"})
+        rest: List[str] = parts[3:]
+        if parts[0] == "assets":
+            return self._send_asset(repo.asset)
+        if parts[0] == "projects":
+            if parts[1] == "columns":
+                return self._send_json(200, repo.cards(int(parts[3])), endpoint="cards")
+            return self._send_json(200, repo.columns(), endpoint="columns")
+        if rest == ["issues"]:
+            return self._send_page("issues", repo.issues(since), query)
+        if rest == ["issues", "comments"]:
+            return self._send_page("repo-comments", repo.all_comments(since), query)
+        if len(rest) == 3 and rest[0] == "issues" and rest[2] == "comments":
+            return self._send_page("comments", repo.comments(int(rest[1])), query)
+        if len(rest) == 2 and rest[0] == "pulls":
+            return self._send_json(200, repo.pull(int(rest[1])), endpoint="pulls")
+        if rest == ["releases"]:
+            return self._send_page("releases", repo.releases(), query)
+        if rest == ["projects"]:
+            return self._send_json(200, repo.projects(), endpoint="projects")
+        self._send_json(404, {"message": "Not Found"})
+
+    def _send_page(self, endpoint: str, items: List[Any], query: Dict[str, List[str]]) -> None:
+        per_page: int = min(int(query.get("per_page", ["30"])[0]), 100)
+        page: int = int(query.get("page", ["1"])[0])
+        links: List[str] = []
+        if page * per_page < len(items):
+            other_params: str = "&".join(f"{k}={v[0]}" for k, v in query.items() if k != "page")
+            links.append(f'<{self.server.base_url}{urlparse(self.path).path}?{other_params}&page={page + 1}>; rel="next"')
+            links.append(f'<{self.server.base_url}{urlparse(self.path).path}?{other_params}&page={(len(items) - 1) // per_page + 1}>; rel="last"')
+        self._send_json(200, items[(page - 1) * per_page:page * per_page], endpoint=endpoint, headers={"Link": ", ".join(links)} if links else {})
+
+    def _send_json(self, status: int, data: Any, endpoint: str = "other", headers: Optional[Dict[str, str]] = None, count: bool = True) -> None:
+        body: bytes = json.dumps(data).encode("utf-8")
+        etag: str = f'W/"{hashlib.md5(body).hexdigest()}"'
+        not_modified: bool = self.headers.get("If-None-Match") == etag
+        rate_limit_headers: Dict[str, str] = self._count(endpoint, costs_rate_limit=not not_modified) if count else {}
+        if count and (self.server.latency or self.server.item_latency):
+            # large pages take github far longer than small ones
+            sleep(self.server.latency + self.server.item_latency * (len(data) if isinstance(data, list) else 1))
+        if count and rate_limit_headers["X-RateLimit-Remaining"] == "-1":
+            status, body, not_modified = 403, b'{"message": "API rate limit exceeded"}', False
+            rate_limit_headers["X-RateLimit-Remaining"] = "0"
+        self.send_response(304 if not_modified else status)
+        for key, value in {**rate_limit_headers, **(headers or {}), "ETag": etag}.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", "0" if not_modified else str(len(body)))
+        self.end_headers()
+        if not not_modified:
+            self.wfile.write(body)
+
+    def _send_asset(self, asset: bytes) -> None:
+        self._count("assets", costs_rate_limit=False)  # downloads are not part of the api rate-limit
+        if self.server.latency:
+            sleep(self.server.latency)
+        start: int = 0
+        if (range_header := self.headers.get("Range", "")).startswith("bytes="):
+            start = int(range_header[6:].split("-")[0])
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(asset) - start))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(asset) - 1}/{len(asset)}")
+        self.end_headers()
+        self.wfile.write(asset[start:])
+
+    def _count(self, endpoint: str, costs_rate_limit: bool) -> Dict[str, str]:
+        with self.server.lock:
+            self.server.requests[endpoint] = self.server.requests.get(endpoint, 0) + 1
+            if costs_rate_limit:
+                self.server.rate_limit_used += 1
+            remaining: int = self.server.rate_limit - self.server.rate_limit_used
+            return {
+                "X-RateLimit-Limit": str(self.server.rate_limit),
+                "X-RateLimit-Remaining": str(max(remaining, -1)),
+                "X-RateLimit-Used": str(self.server.rate_limit_used),
+                "X-RateLimit-Reset": str(self.server.rate_limit_reset),
+                "X-RateLimit-Resource": "core",
+            }
+
+
+def _serve(port: int, config: Dict[str, Any]) -> None:
+    MockGithub(port, config).serve_forever()
+
+
+class _ApiRedirectAdapter(HTTPAdapter):
+    """sends the requests for api.github.com to the mock server"""
+
+    def __init__(self, base_url: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._base_url: str = base_url
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        assert request.url is not None
+        request.url = self._base_url + request.url[len(GITHUB_API_URL):]
+        return super().send(request, **kwargs)
+
+
+def _load_backuper() -> ModuleType:
+    spec = importlib.util.spec_from_file_location("github_repo_backuper", path.join(path.dirname(path.abspath(__file__)), "github-repo-backuper.py"))
+    assert spec is not None and spec.loader is not None
+    module: ModuleType = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run_backup(ghrb: ModuleType, base_url: str, repo: str, options: Dict[str, Any], measure_memory: bool) -> Dict[str, Any]:
+    run_stats = ghrb.RunStats()
+    if measure_memory:
+        tracemalloc.start()
+    start: float = perf_counter()
+    try:
+        ghrb.GithubRepoBackuper(repo_owner=OWNER, repo_name=repo, skip_code=True, run_stats=run_stats, **options).start_backup()
+    finally:
+        wall: float = perf_counter() - start
+        peak: Optional[int] = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        if measure_memory:
+            tracemalloc.stop()
+    server: Dict[str, Any] = requests.post(f"{base_url}/_bench/reset", json={}).json()
+    total_requests: int = sum(server["requests"].values())
+    totals: Dict[str, float] = run_stats.to_json()["totals"]
+    return {
+        "wall_seconds": round(wall, 3),
+        "requests": total_requests,
+        "requests_per_second": round(total_requests / wall, 1) if wall else None,
+        "rate_limit_used": server["rate_limit_used"],
+        "requests_by_endpoint": server["requests"],
+        "bytes_downloaded": int(totals["bytes_downloaded"]),
+        "bytes_written": int(totals["bytes_written"]),
+        "files_written": int(totals["files_written"]),
+        "peak_memory_bytes": peak,
+    }
+
+
+def _compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """returns the regressions (more requests, slower, more memory) compared to a earlier --json report"""
+    regressions: List[str] = []
+    old: Dict[Tuple[int, str], Dict[str, Any]] = {(r["size"], r["run"]): r for r in baseline}
+    for result in results:
+        if (before := old.get((result["size"], result["run"]))) is None:
+            continue
+        name: str = f"{result['size']} issues ({result['run']})"
+        if result["requests"] > before["requests"]:
+            regressions.append(f"{name}: {before['requests']} -> {result['requests']} requests")
+        # requests/sec is no good measure here: a change saving requests lowers it
+        if result["wall_seconds"] > before["wall_seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {before['wall_seconds']}s -> {result['wall_seconds']}s")
+        if before.get("peak_memory_bytes") and result.get("peak_memory_bytes") and result["peak_memory_bytes"] > before["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(f"{name}: {before['peak_memory_bytes']} -> {result['peak_memory_bytes']} bytes peak memory")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="github-repo-backuper-benchmark",
+        description="Benchmark github-repo-backuper against a local mock of the github api",
+    )
+    parser.add_argument("--sizes", type=str, default="100,1000", help="Comma separated issue counts of the synthetic repos.")
+    parser.add_argument("--comments", type=int, default=5, help="Average number of comments per issue.")
+    parser.add_argument("--releases", type=int, default=5, help="Number of releases (with 1 asset each) per repo.")
+    parser.add_argument("--asset-size", type=int, default=1 << 20, help="Size of each release asset in bytes.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the mock server waits before each response.")
+    parser.add_argument("--item-latency", type=float, default=0.003, help="Additional seconds per item of a listing (a page of 100 issues takes github longer than a single issue).")
+    parser.add_argument("--rate-limit", type=int, default=100000, help="Rate-limit reported by the mock server (reset before every run).")
+    parser.add_argument("--touched", type=float, default=0.05, help="Fraction of issues updated (with a new comment) before the incremental run.")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure peak memory (tracemalloc slows the backup down).")
+    parser.add_argument("--json", type=str, metavar="FILE", help="Write the results as json.")
+    parser.add_argument("--compare", type=str, metavar="FILE", help="Compare with a earlier --json report and exit with 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown / memory growth for --compare (request counts must not grow at all).")
+    parser.add_argument("--verbose", action="store_true", help="Show the log of the backuper.")
+    # passed on to the backuper
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--asset-jobs", type=int, default=1)
+    parser.add_argument("--bulk-comments", action="store_true")
+    parser.add_argument("--detailed-prs", action="store_true")
+    parser.add_argument("--compress", type=str)
+    parser.add_argument("--issue-storage", choices=["files", "packed"], default="files")
+    parser.add_argument("--http-cache", action="store_true")
+    args = parser.parse_args()
+
+    sizes: List[int] = [int(size) for size in args.sizes.split(",")]
+    config: Dict[str, Any] = {
+        "sizes": sizes,
+        "comments": args.comments,
+        "releases": args.releases,
+        "asset_size": args.asset_size,
+        "latency": args.latency,
+        "item_latency": args.item_latency,
+        "rate_limit": args.rate_limit,
+    }
+    with tempfile.TemporaryDirectory(prefix="ghrb-benchmark-") as workdir:
+        port: int = 0
+        with ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler) as probe:  # find a free port
+            port = probe.server_address[1]
+        # separate process -> the server neither competes for the GIL nor shows up in the memory measurement
+        server = multiprocessing.Process(target=_serve, args=(port, config), daemon=True)
+        server.start()
+        base_url: str = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                requests.post(f"{base_url}/_bench/reset", json={})
+                break
+            except requests.ConnectionError:
+                sleep(0.05)
+
+        ghrb: ModuleType = _load_backuper()
+        ghrb.logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        session: requests.Session = ghrb.configure_http_session(pool_size=max(args.jobs, args.asset_jobs, 10), retries=0)
+        session.mount(GITHUB_API_URL, _ApiRedirectAdapter(base_url, pool_connections=1, pool_maxsize=max(args.jobs, args.asset_jobs, 10)))
+        options: Dict[str, Any] = {
+            "jobs": args.jobs,
+            "asset_jobs": args.asset_jobs,
+            "bulk_comments": args.bulk_comments,
+            "detailed_prs": args.detailed_prs,
+            "compress": args.compress,
+            "issue_storage": args.issue_storage,
+            "http_cache": args.http_cache,
+            "include_releases": args.releases > 0,
+            "include_projects": True,
+        }
+
+        results: List[Dict[str, Any]] = []
+        cwd: str = os.getcwd()
+        os.chdir(workdir)  # the backuper writes into ./github
+        try:
+            print(f"{'issues':>8} {'run':<12} {'seconds':>8} {'requests':>9} {'req/s':>8} {'rate-limit':>10} {'peak MiB':>9}")
+            for size in sizes:
+                for run in ("full", "incremental"):
+                    if run == "incremental":
+                        requests.post(f"{base_url}/_bench/touch", json={"repo": f"size-{size}", "fraction": args.touched})
+                    result: Dict[str, Any] = {"size": size, "run": run, **_run_backup(ghrb, base_url, f"size-{size}", options, not args.no_memory)}
+                    results.append(result)
+                    peak: str = f"{result['peak_memory_bytes'] / (1 << 20):.1f}" if result["peak_memory_bytes"] is not None else "-"
+                    print(f"{size:>8} {run:<12} {result['wall_seconds']:>8} {result['requests']:>9} {result['requests_per_second']:>8} {result['rate_limit_used']:>10} {peak:>9}")
+        finally:
+            os.chdir(cwd)
+            server.terminate()
+
+    report: Dict[str, Any] = {"config": config, "options": options, "results": results}
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            regressions: List[str] = _compare(results, json.load(fp)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,30 @@ import requests
 import json
 import logging
 import gzip
-from typing import Optional, List, Dict, Any, Generator
-from time import sleep, time, strftime, gmtime
-from math import floor
-from os import makedirs, path, environ
-from sys import stdout
+import threading
+import hashlib
+import os
+import queue
+import sqlite3
+import socket
+import socketserver
+import signal
+import calendar
+import contextvars
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Generator, Deque, Tuple, Union, Callable, Iterator
+from time import sleep, time, strftime, strptime, gmtime
+from os import makedirs, path, environ, listdir
+from sys import stdout, exit
+try:
+    import zstandard  # optional: only needed for --compress zstd
+except ImportError:
+    zstandard = None
 
 
 logger = logging.getLogger(__name__)
@@ -55,6 +74,1246 @@ GITHUB_HEADERS: Dict[str, str] = {
 }
 
 
+RETRY_STATUS_CODES: List[int] = [500, 502, 503, 504]
+GITHUB_NAME_CHARACTERS: str = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_."
+
+_http_session: Optional[requests.Session] = None
+
+
+class PhaseStats:
+    """counters of one phase (example: issues) of one repo. updated by all threads working on it."""
+    COUNTERS: Tuple[str, ...] = (
+        "requests",
+        "rate_limit_units",
+        "rate_limit_sleep_seconds",
+        "bytes_downloaded",
+        "bytes_written",
+        "files_written",
+    )
+
+    def __init__(self) -> None:
+        self.wall_seconds: float = 0.0
+        self.counters: Dict[str, float] = {counter: 0 for counter in self.COUNTERS}
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, **amounts: float) -> None:
+        with self._lock:
+            for counter, amount in amounts.items():
+                self.counters[counter] += amount
+
+    def to_json(self) -> Dict[str, float]:
+        with self._lock:
+            return {"wall_seconds": round(self.wall_seconds, 3), **{k: round(v, 3) for k, v in self.counters.items()}}
+
+
+# the phase the current thread works on (copied into worker threads by _submit_in_context)
+_current_phase: contextvars.ContextVar[Optional[PhaseStats]] = contextvars.ContextVar("ghrb_current_phase", default=None)
+
+
+def _record(**amounts: float) -> None:
+    """adds to the counters of the current phase (if there is one)"""
+    if (stats := _current_phase.get()) is not None:
+        stats.add(**amounts)
+
+
+def _submit_in_context(executor: ThreadPoolExecutor, function: Callable[..., Any], *args: Any) -> Future:
+    """executor.submit, but the work still counts towards the phase it got submitted from"""
+    return executor.submit(contextvars.copy_context().run, function, *args)
+
+
+class RunStats:
+    """
+    Per repo and phase statistics of a run (wall time, requests, rate-limit usage, etc).
+    Written as json (--stats-json) and/or as prometheus textfile (--prometheus-textfile).
+    """
+
+    def __init__(self) -> None:
+        self._start: float = time()
+        self._phases: Dict[Tuple[str, str], PhaseStats] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, repo: str, phase: str) -> Iterator[PhaseStats]:
+        with self._lock:
+            stats: PhaseStats = self._phases.setdefault((repo, phase), PhaseStats())
+        token: contextvars.Token = _current_phase.set(stats)
+        start: float = time()
+        try:
+            yield stats
+        finally:
+            _current_phase.reset(token)
+            with stats._lock:
+                stats.wall_seconds += time() - start
+
+    def forget(self, repo: str) -> None:
+        """drops the statistics of a repo (the daemon only reports the last backup of each repo)"""
+        with self._lock:
+            self._phases = {key: stats for key, stats in self._phases.items() if key[0] != repo}
+
+    def repo_totals(self, repo: str) -> Dict[str, float]:
+        with self._lock:
+            phases: List[PhaseStats] = [stats for key, stats in self._phases.items() if key[0] == repo]
+        totals: Dict[str, float] = {counter: 0 for counter in PhaseStats.COUNTERS}
+        for stats in phases:
+            for counter, value in stats.to_json().items():
+                if counter in totals:
+                    totals[counter] += value
+        return totals
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            phases: List[Tuple[Tuple[str, str], PhaseStats]] = list(self._phases.items())
+        repos: Dict[str, Dict[str, Dict[str, float]]] = {}
+        totals: Dict[str, float] = {counter: 0 for counter in PhaseStats.COUNTERS}
+        for (repo, phase), stats in phases:
+            repos.setdefault(repo, {})[phase] = stats.to_json()
+            for counter in PhaseStats.COUNTERS:
+                totals[counter] += repos[repo][phase][counter]
+        return {
+            "start_time": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime(self._start)),
+            "wall_seconds": round(time() - self._start, 3),
+            "totals": {k: round(v, 3) for k, v in totals.items()},
+            "repos": repos,
+        }
+
+    def write_json(self, filepath: str) -> None:
+        with open(f"{filepath}.tmp", "w") as fp:
+            json.dump(self.to_json(), fp, indent=2)
+        os.replace(f"{filepath}.tmp", filepath)
+
+    def write_prometheus(self, filepath: str) -> None:
+        """node_exporter textfile-collector format (written atomically, since it might get read at any time)"""
+        report: Dict[str, Any] = self.to_json()
+        lines: List[str] = [
+            "# HELP ghrb_run_wall_seconds Duration of the last github-repo-backuper run.",
+            "# TYPE ghrb_run_wall_seconds gauge",
+            f"ghrb_run_wall_seconds {report['wall_seconds']}",
+            "# HELP ghrb_run_end_timestamp_seconds End of the last github-repo-backuper run.",
+            "# TYPE ghrb_run_end_timestamp_seconds gauge",
+            f"ghrb_run_end_timestamp_seconds {int(time())}",
+        ]
+        for counter in ("wall_seconds", *PhaseStats.COUNTERS):
+            lines.append(f"# HELP ghrb_phase_{counter} {counter.replace('_', ' ')} per repo and backup phase (last run).")
+            lines.append(f"# TYPE ghrb_phase_{counter} gauge")
+            for repo, phases in report["repos"].items():
+                for phase, stats in phases.items():
+                    lines.append(f'ghrb_phase_{counter}{{repo="{repo}",phase="{phase}"}} {stats[counter]}')
+        with open(f"{filepath}.tmp", "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+        os.replace(f"{filepath}.tmp", filepath)
+
+
+class BackupScheduler:
+    """
+    Backs up multiple repos at once.
+    git clone/fetch (network-bound) and api work (rate-limit-bound) run in separate pools, so that they overlap.
+    A repos ghrb.json gets updated once both of its parts succeeded.
+    """
+
+    def __init__(self, repo_jobs: int) -> None:
+        self._api_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max(repo_jobs, 1), thread_name_prefix="ghrb-api")
+        self._git_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max(repo_jobs, 1), thread_name_prefix="ghrb-git")
+        self._lock: threading.Lock = threading.Lock()
+        self._results: Dict[str, Future] = {}
+
+    def submit(self, backuper: "GithubRepoBackuper") -> Future:
+        backuper.begin_backup()
+        result: Future = Future()
+        parts: List[Future] = [self._api_pool.submit(backuper.backup_api), self._git_pool.submit(backuper.backup_git)]
+        remaining: List[int] = [len(parts)]
+
+        def on_part_done(_: Future) -> None:
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            errors: List[BaseException] = [e for e in (part.exception() for part in parts) if e is not None]
+            if errors:
+                logger.error(f"Backup of {backuper.full_name} failed: {errors[0]!r}")
+                result.set_exception(errors[0])
+                return
+            try:
+                backuper.finish_backup()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            logger.info(f"Finished backup of {backuper.full_name}")
+            result.set_result(None)
+
+        for part in parts:
+            part.add_done_callback(on_part_done)
+        self._results[backuper.full_name] = result
+        return result
+
+    def wait(self) -> Dict[str, BaseException]:
+        """waits for all submitted backups and returns the failed ones"""
+        failed: Dict[str, BaseException] = {}
+        for name, result in self._results.items():
+            if (error := result.exception()) is not None:
+                failed[name] = error
+        self._api_pool.shutdown()
+        self._git_pool.shutdown()
+        return failed
+
+
+# what a daemon job (config or --daemon-submit) may set. everything else (tokens, cache, etc) comes from the daemons command line.
+DAEMON_JOB_OPTIONS: Tuple[str, ...] = (
+    "prune", "detailed_prs", "include_lfs", "include_releases", "include_wiki", "include_projects", "gzip", "compress",
+    "zstd_dictionary", "bulk_comments", "api", "issue_storage", "dedup_assets", "jobs", "asset_jobs",
+)
+DAEMON_JOB_CHOICES: Dict[str, Tuple[str, ...]] = {"api": ("rest", "graphql"), "issue_storage": ("files", "packed")}
+DAEMON_TICK: int = 30  # seconds between scheduling rounds (submissions and finished backups wake it up earlier)
+DAEMON_DEFAULT_COST: int = 200  # estimated rate-limit cost of a repo without statistics
+DAEMON_STATE_FILE: str = path.join("github", ".ghrb-daemon.json")
+
+
+class _DaemonJob:
+    def __init__(self, owner: str, name: str, options: Dict[str, Any], interval: float) -> None:
+        self.owner: str = owner
+        self.name: str = name
+        self.options: Dict[str, Any] = options  # from the config
+        self.interval: float = interval
+        self.requested: bool = False  # submitted -> before everything else
+        self.requested_options: Dict[str, Any] = {}  # from the submissions (only for the next backup)
+        self.pushed_at: Optional[str] = None  # from the repo list of the owner (if known)
+        self.failures: int = 0
+        self.retry_at: float = 0
+        self.configured: bool = False  # part of the config (otherwise only submitted)
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+
+class BackupDaemon:
+    """
+    Keeps a fleet of repos backed up (--daemon CONFIG.json).
+
+    config example:
+        {
+            "interval": 86400,
+            "min_interval": 900,
+            "repo_jobs": 2,
+            "socket": "ghrb.sock",
+            "options": {"include_releases": true},
+            "repos": [
+                {"owner": "jan9103", "name": "github-repo-backuper", "interval": 3600},
+                {"owner": "torvalds", "include_forks": false, "options": {"include_wiki": true}}
+            ]
+        }
+    interval: seconds between backups of a inactive repo. active repos get backed up more often (down to min_interval).
+    entries without a name: all repos of the owner (the list gets refreshed every owner_refresh seconds).
+    socket: unix socket for job submissions (--daemon-submit). submitted repos go first and stay part of the fleet
+        (saved in github/.ghrb-daemon.json) once their first backup succeeded.
+
+    due repos get backed up by priority (how overdue they are, weighted with their activity).
+    a backup only starts if its estimated cost (rate-limit usage of its last backup) fits into the remaining rate-limit.
+    """
+
+    def __init__(
+        self,
+        config_file: str,
+        backuper_options: Dict[str, Any],
+        governor: "RateLimitGovernor",
+        run_stats: RunStats,
+        repo_jobs: int = 1,
+        on_backup_done: Optional[Callable[[], None]] = None,
+    ) -> None:
+        with open(config_file, "r") as fp:
+            self._config: Dict[str, Any] = json.load(fp)
+        self._options: Dict[str, Any] = {**backuper_options, **self._job_options(self._config.get("options"))}
+        self._governor: "RateLimitGovernor" = governor
+        self._run_stats: RunStats = run_stats
+        self._on_backup_done: Optional[Callable[[], None]] = on_backup_done
+        self._interval: float = self._config.get("interval", 86400)
+        self._min_interval: float = self._config.get("min_interval", 900)
+        self._repo_jobs: int = max(self._config.get("repo_jobs") or repo_jobs, 1)
+        self._scheduler: BackupScheduler = BackupScheduler(self._repo_jobs)
+        self._lock: threading.Lock = threading.Lock()
+        self._wakeup: threading.Event = threading.Event()
+        self._jobs: Dict[str, _DaemonJob] = {}
+        self._running: Dict[str, int] = {}  # full_name -> estimated cost
+        self._owners_listed_at: Dict[str, float] = {}
+        # full_name -> {"cost": rate-limit units of the last backup, "activity": changed issues per day, "submitted": not from the config}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        if path.exists(DAEMON_STATE_FILE):
+            with open(DAEMON_STATE_FILE, "r") as fp:
+                self._state = json.load(fp)
+        for full_name, state in self._state.items():
+            if state.get("submitted"):
+                owner, name = full_name.split("/", 1)
+                self._jobs[full_name] = _DaemonJob(owner, name, {}, self._interval)
+
+    @staticmethod
+    def _job_options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """checks keys and values (a backup should not fail for a typo only once it starts)"""
+        if not isinstance(options or {}, dict):
+            raise ValueError("options have to be a object")
+        for key, value in (options or {}).items():
+            if key not in DAEMON_JOB_OPTIONS:
+                raise ValueError(f"{key} can not be set per repo (allowed: {', '.join(DAEMON_JOB_OPTIONS)})")
+            if key in ("jobs", "asset_jobs"):
+                if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                    raise ValueError(f"{key} has to be a positive integer")
+            elif key == "compress":
+                if not isinstance(value, str):
+                    raise ValueError("compress has to be a string like zstd:19")
+                try:
+                    Compression(value)
+                except RuntimeError as e:  # zstandard is missing
+                    raise ValueError(str(e))
+            elif key in DAEMON_JOB_CHOICES:
+                if value not in DAEMON_JOB_CHOICES[key]:
+                    raise ValueError(f"{key} has to be one of: {', '.join(DAEMON_JOB_CHOICES[key])}")
+            elif not isinstance(value, bool):
+                raise ValueError(f"{key} has to be true or false")
+        return dict(options or {})
+
+    def _add_repo(self, owner: str, name: str, options: Dict[str, Any], interval: float) -> _DaemonJob:
+        with self._lock:
+            job: Optional[_DaemonJob] = self._jobs.get(f"{owner}/{name}")
+            if job is None:
+                job = self._jobs[f"{owner}/{name}"] = _DaemonJob(owner, name, options, interval)
+            else:  # the config might have changed (replace instead of merging)
+                job.options = options
+                job.interval = interval
+            job.configured = True
+            return job
+
+    def submit(self, owner: str, name: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """queues a backup (before all scheduled ones). returns what happened to it."""
+        for part in (owner, name):
+            if not isinstance(part, str) or part in (".", "..") or not part or any(c not in GITHUB_NAME_CHARACTERS for c in part):
+                raise ValueError(f"invalid repo: {owner}/{name}")
+        options = self._job_options(options)
+        with self._lock:
+            job: _DaemonJob = self._jobs.setdefault(f"{owner}/{name}", _DaemonJob(owner, name, {}, self._interval))
+            status: str = "coalesced" if job.requested else ("queued after the running backup" if job.full_name in self._running else "queued")
+            job.requested = True
+            job.requested_options = {**job.requested_options, **options}
+            job.retry_at = 0
+        logger.info(f"daemon: {job.full_name} submitted ({status})")
+        self._wakeup.set()
+        return status
+
+    def run(self) -> None:
+        server: Optional[socketserver.BaseServer] = self._start_socket_server()
+        # a stopped daemon is no problem (the backups resume), but running backups get a chance to finish
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        try:
+            while True:
+                self._wakeup.clear()
+                self._list_owners()
+                self._schedule()
+                self._wakeup.wait(DAEMON_TICK)
+        except KeyboardInterrupt:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)  # a second one stops it right away
+            logger.info("daemon: stopping (waiting for the running backups)..")
+        finally:
+            if server is not None:  # no new submissions
+                server.shutdown()
+                server.server_close()
+            self._scheduler.wait()
+            if server is not None:
+                try:
+                    os.remove(self._config["socket"])
+                except FileNotFoundError:
+                    pass
+
+    def _start_socket_server(self) -> Optional[socketserver.BaseServer]:
+        if not self._config.get("socket"):
+            return None
+        if path.exists(self._config["socket"]):  # left behind by a killed daemon
+            os.remove(self._config["socket"])
+        server = _DaemonSocketServer(self._config["socket"], self)
+        os.chmod(self._config["socket"], 0o600)
+        threading.Thread(target=server.serve_forever, name="ghrb-daemon-socket", daemon=True).start()
+        logger.info(f"daemon: accepting jobs on {self._config['socket']}")
+        return server
+
+    def _list_owners(self) -> None:
+        for entry in self._config.get("repos") or []:
+            options: Dict[str, Any] = self._job_options(entry.get("options"))
+            interval: float = entry.get("interval", self._interval)
+            if entry.get("name"):
+                self._add_repo(entry["owner"], entry["name"], options, interval)
+                continue
+            if time() - self._owners_listed_at.get(entry["owner"], 0) < self._config.get("owner_refresh", 3600):
+                continue
+            try:
+                with self._run_stats.measure(entry["owner"], "list"):
+                    repos: List[Dict[str, Any]] = list(_gh_paginated(
+                        f"https://api.github.com/users/{entry['owner']}/repos?per_page=100",
+                        governor=self._governor,
+                        cache=self._options.get("response_cache"),
+                    ))
+            except requests.RequestException as e:
+                logger.error(f"daemon: listing the repos of {entry['owner']} failed: {e!r}")
+                continue
+            self._owners_listed_at[entry["owner"]] = time()
+            _write_owner_manifest(entry["owner"], repos)
+            for repo in repos:
+                if repo.get("fork") and not entry.get("include_forks"):
+                    continue
+                self._add_repo(entry["owner"], repo["name"], options, interval).pushed_at = repo.get("pushed_at")
+
+    def _priority(self, job: _DaemonJob, now: float) -> Optional[float]:
+        """None = not due"""
+        if now < job.retry_at:
+            return None
+        if job.requested:
+            return float("inf")
+        last_backup: Optional[str] = _read_last_backup(job.owner, job.name)
+        if last_backup is None:
+            return 1e9  # never backed up
+        activity: float = self._state.get(job.full_name, {}).get("activity", 0)
+        if job.pushed_at is not None and job.pushed_at > last_backup:
+            activity += 1
+        interval: float = max(job.interval / (1 + activity), min(self._min_interval, job.interval))
+        age: float = now - calendar.timegm(strptime(last_backup, "%Y-%m-%dT%H:%M:%SZ"))
+        if age < interval:
+            return None
+        return age / interval * (1 + activity)
+
+    def _schedule(self) -> None:
+        now: float = time()
+        with self._lock:
+            candidates: List[Tuple[float, _DaemonJob]] = [
+                (priority, job) for job in self._jobs.values()
+                if job.full_name not in self._running and (priority := self._priority(job, now)) is not None
+            ]
+            running: Dict[str, int] = dict(self._running)
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        available: Optional[int] = self._governor.available()
+        if available is not None:  # the running backups still need (roughly) the rest of their estimate
+            available -= sum(max(cost - int(self._run_stats.repo_totals(name)["rate_limit_units"]), 0) for name, cost in running.items())
+        for _, job in candidates:
+            if len(running) >= self._repo_jobs:
+                return
+            cost: int = int(self._state.get(job.full_name, {}).get("cost", DAEMON_DEFAULT_COST))
+            if not job.requested and available is not None and cost > available and running:
+                logger.debug(f"daemon: {job.full_name} (~{cost} requests) does not fit into the remaining rate-limit ({available})")
+                continue
+            # nothing running -> start it even if it does not fit (the governor waits for the reset)
+            self._start(job, cost)
+            running[job.full_name] = cost
+            if available is not None:
+                available -= cost
+
+    def _start(self, job: _DaemonJob, cost: int) -> None:
+        with self._lock:
+            self._running[job.full_name] = cost
+            job.requested = False
+            options: Dict[str, Any] = {**self._options, **job.options, **job.requested_options}
+            job.requested_options = {}
+        last_backup: Optional[str] = _read_last_backup(job.owner, job.name)
+        logger.info(f"daemon: starting backup of {job.full_name}")
+        self._run_stats.forget(job.full_name)
+        try:
+            backuper = GithubRepoBackuper(
+                repo_owner=job.owner,
+                repo_name=job.name,
+                **options,
+                # like --skip-untouched: the repo list says there was no push
+                skip_code=job.pushed_at is not None and last_backup is not None and job.pushed_at <= last_backup,
+            )
+            result: Future = self._scheduler.submit(backuper)
+        except Exception as e:
+            logger.error(f"daemon: backup of {job.full_name} failed to start: {e!r}")
+            result = Future()
+            result.set_exception(e)
+            self._backup_done(job, None, last_backup, result)
+            return
+        result.add_done_callback(lambda result: self._backup_done(job, backuper, last_backup, result))
+
+    def _backup_done(self, job: _DaemonJob, backuper: Optional["GithubRepoBackuper"], previous_backup: Optional[str], result: Future) -> None:
+        now: float = time()
+        with self._lock:
+            del self._running[job.full_name]
+            error: Optional[BaseException] = result.exception()
+            if error is not None and not job.configured and not job.requested and (
+                backuper is None or previous_backup is None or _is_not_found(error)
+            ):  # a submitted repo, which never worked (typo, deleted, etc) -> no retries
+                logger.error(f"daemon: dropping {job.full_name} (not part of the config)")
+                del self._jobs[job.full_name]
+                if self._state.pop(job.full_name, None) is not None:
+                    self._save_state()
+            elif error is not None:
+                job.failures += 1
+                job.retry_at = now + min(job.interval, 300 * 2 ** min(job.failures - 1, 10))
+            elif backuper is not None:
+                job.failures = 0
+                state: Dict[str, Any] = self._state.setdefault(job.full_name, {})
+                if not job.configured:
+                    state["submitted"] = True
+                if previous_backup is not None:  # a initial backup says nothing about the usual cost and activity
+                    days: float = max((now - calendar.timegm(strptime(previous_backup, "%Y-%m-%dT%H:%M:%SZ"))) / 86400, 1 / 24)
+                    # smoothed -> a single busy day does not dominate
+                    state["activity"] = round((state.get("activity", 0) + backuper.issues_written / days) / 2, 3)
+                state["cost"] = self._run_stats.repo_totals(job.full_name)["rate_limit_units"]
+                self._save_state()
+        if self._on_backup_done is not None:
+            self._on_backup_done()
+        self._wakeup.set()
+
+    def _save_state(self) -> None:
+        with open(f"{DAEMON_STATE_FILE}.tmp", "w") as fp:
+            json.dump(self._state, fp, indent=1)
+        os.replace(f"{DAEMON_STATE_FILE}.tmp", DAEMON_STATE_FILE)
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """one json object per line: {"command": "submit", "owner": "...", "name": "...", "options": {...}}"""
+    server: "_DaemonSocketServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request: Dict[str, Any] = json.loads(line)
+                if request.get("command") != "submit":
+                    raise ValueError(f"unknown command: {request.get('command')}")
+                response: Dict[str, Any] = {"status": self.server.backup_daemon.submit(request["owner"], request["name"], request.get("options"))}
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class _DaemonSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_file: str, backup_daemon: BackupDaemon) -> None:
+        self.backup_daemon: BackupDaemon = backup_daemon
+        super().__init__(socket_file, _DaemonRequestHandler)
+
+
+def _is_not_found(error: BaseException) -> bool:
+    return isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 404
+
+
+def _raise_keyboard_interrupt(*_: Any) -> None:
+    raise KeyboardInterrupt()
+
+
+def daemon_submit(socket_file: str, owner: str, name: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """queues a backup in a running daemon (--daemon-submit)"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_file)
+        connection.sendall(json.dumps({"command": "submit", "owner": owner, "name": name, "options": options or {}}).encode("utf-8") + b"\n")
+        response: Dict[str, Any] = json.loads(connection.makefile("rb").readline())
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["status"]
+
+
+def configure_http_session(pool_size: int = 10, retries: int = 3, backoff: float = 1.0) -> requests.Session:
+    """
+    all github-api, asset, etc traffic goes through this session -> connections (and tls) get reused.
+    retries cover 5xx responses and connection errors (resets, timeouts) with exponential backoff.
+    """
+    global _http_session
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=["GET", "POST"],  # POST is only used for (read-only) graphql queries
+            raise_on_status=False,  # the last response gets returned and handled like before
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    _http_session = session
+    return session
+
+
+def _get_http_session() -> requests.Session:
+    if _http_session is None:
+        return configure_http_session()
+    return _http_session
+
+
+# the issue-index is saved together with the issue-checkpoint, but at most every X seconds (rewriting it every page would be slow)
+ISSUE_INDEX_SAVE_INTERVAL: int = 30
+
+# pages fetched in the background while the current one is processed (0 = fetch the next page when it is needed)
+PAGINATION_PREFETCH: int = 2
+_JSON_DECODER: json.JSONDecoder = json.JSONDecoder()
+
+
+DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+DOWNLOAD_ATTEMPTS: int = 5
+DOWNLOAD_TIMEOUT: int = 60  # seconds without data (not total)
+
+ZSTD_DICTIONARY_SIZE: int = 112640  # zstd's default
+ZSTD_DICTIONARY_MAX_SAMPLES: int = 5000
+
+
+class Compression:
+    """
+    "none", "gzip", or "zstd[:level]" (--compress).
+    zstd can use a per-repo dictionary (trained from existing issues), which helps a lot with small and repetitive json.
+    """
+    MAGIC_GZIP: bytes = b"\x1f\x8b"
+    MAGIC_ZSTD: bytes = b"\x28\xb5\x2f\xfd"
+
+    def __init__(self, spec: str = "none", dictionary: Optional[bytes] = None) -> None:
+        self.name, _, level = spec.partition(":")
+        if self.name not in ("none", "gzip", "zstd"):
+            raise ValueError(f"unknown compression: {spec} (expected none, gzip, or zstd)")
+        if self.name == "zstd" and zstandard is None:
+            raise RuntimeError("--compress zstd requires the zstandard python package (pip install zstandard)")
+        self.level: Optional[int] = None
+        if level:
+            levels: range = {"none": range(0), "gzip": range(0, 10), "zstd": range(1, zstandard.MAX_COMPRESSION_LEVEL + 1 if zstandard else 23)}[self.name]
+            if not level.lstrip("-").isdigit() or int(level) not in levels:
+                raise ValueError(f"invalid compression level: {spec} (" + (f"{self.name} supports {levels.start}-{levels.stop - 1})" if levels else "none has no levels)"))
+            self.level = int(level)
+        self.dictionary: Optional[bytes] = dictionary
+
+    @property
+    def enabled(self) -> bool:
+        return self.name != "none"
+
+    @property
+    def extension(self) -> str:
+        return {"none": "", "gzip": ".gz", "zstd": ".zst"}[self.name]
+
+    def compress(self, data: bytes, use_dictionary: bool = False) -> bytes:
+        if self.name == "gzip":
+            return gzip.compress(data, **({"compresslevel": self.level} if self.level is not None else {}))
+        if self.name == "zstd":
+            return self._zstd_compressor(use_dictionary).compress(data)
+        return data
+
+    def _zstd_compressor(self, use_dictionary: bool) -> Any:
+        return zstandard.ZstdCompressor(
+            level=self.level if self.level is not None else 3,
+            **({"dict_data": zstandard.ZstdCompressionDict(self.dictionary)} if use_dictionary and self.dictionary else {}),
+        )
+
+    def stream_writer(self, fp: Any) -> Any:
+        """compressing file-like wrapper (used for release assets)"""
+        if self.name == "gzip":
+            return gzip.GzipFile(fileobj=fp, mode="wb", **({"compresslevel": self.level} if self.level is not None else {}))
+        if self.name == "zstd":
+            return self._zstd_compressor(False).stream_writer(fp)
+        return fp
+
+    @staticmethod
+    def decompress(data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        """detects the format based on the magic bytes (works independent of the current setting)"""
+        if data[:2] == Compression.MAGIC_GZIP:
+            return gzip.decompress(data)
+        if data[:4] == Compression.MAGIC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("reading zstd compressed files requires the zstandard python package (pip install zstandard)")
+            # frames without dictionary can be read with a dictionary as well
+            decompressor = zstandard.ZstdDecompressor(**({"dict_data": zstandard.ZstdCompressionDict(dictionary)} if dictionary else {}))
+            return decompressor.decompressobj().decompress(data)
+        return data
+
+
+class BlobStore:
+    """
+    Content-addressed storage for release assets shared by all repos (github/.blobs/sha256/AB/ABCDEF...).
+    release directories only contain hardlinks (or symlinks if hardlinks are not possible) to it,
+    so identical assets (forks, re-uploads, etc) are only stored (and downloaded) once.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._directory: str = directory
+
+    def blob_path(self, sha256: str, extension: str = "") -> str:
+        """extension: the compression of the blob (the same asset can be stored compressed and uncompressed)"""
+        return path.join(self._directory, "sha256", sha256[:2], f"{sha256}{extension}")
+
+    def link(self, blob: str, target: str) -> None:
+        tmp_target: str = f"{target}.link-tmp"
+        if path.lexists(tmp_target):
+            os.remove(tmp_target)
+        try:
+            os.link(blob, tmp_target)
+        except OSError:  # different filesystem, no hardlink support, etc
+            os.symlink(path.relpath(blob, path.dirname(target)), tmp_target)
+        os.replace(tmp_target, target)
+
+    def add(self, file: str, sha256: str, extension: str = "") -> None:
+        """moves the file into the store and replaces it with a link"""
+        blob: str = self.blob_path(sha256, extension)
+        makedirs(path.dirname(blob), exist_ok=True)
+        if path.exists(blob):
+            os.remove(file)
+        else:
+            os.replace(file, blob)
+        self.link(blob, file)
+
+
+class SearchIndex:
+    """
+    Full-text index (sqlite fts5) of the issues and PRs (title, body, comments, labels, authors) of all repos.
+    Updated while issues get written -> searching does not require opening any issue file.
+    Shared by all repos of a run (thread-safe).
+    """
+    COMMIT_INTERVAL: int = 500  # documents
+
+    def __init__(self, db_file: str) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._uncommitted: int = 0
+        self._db: sqlite3.Connection = sqlite3.connect(db_file, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # searches while a backup is running
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                repo TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                title TEXT,
+                state TEXT,
+                is_pull_request INTEGER,
+                created_at TEXT,
+                UNIQUE (repo, number)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(title, body, comments, labels, authors);
+            -- repos whose issues from before the index existed got added completely
+            CREATE TABLE IF NOT EXISTS backfilled_repos (repo TEXT PRIMARY KEY);
+        """)
+        self._db.commit()
+
+    def is_backfilled(self, repo: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM backfilled_repos WHERE repo = ?", (repo,)).fetchone() is not None
+
+    def mark_backfilled(self, repo: str) -> None:
+        """call once all existing issues of the repo got added (add commits in between -> documents alone say nothing)"""
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO backfilled_repos (repo) VALUES (?)", (repo,))
+            self._db.commit()
+            self._uncommitted = 0
+
+    def add(self, repo: str, number: Union[int, str], issue: Dict[str, Any]) -> None:
+        """adds or replaces a issue"""
+        comments: List[Dict[str, Any]] = issue.get("comments") or []
+        with self._lock:
+            row: Optional[Tuple[int]] = self._db.execute("SELECT id FROM documents WHERE repo = ? AND number = ?", (repo, int(number))).fetchone()
+            if row is not None:
+                self._db.execute("DELETE FROM documents_fts WHERE rowid = ?", row)
+                self._db.execute("DELETE FROM documents WHERE id = ?", row)
+            id: Optional[int] = self._db.execute(
+                "INSERT INTO documents (repo, number, title, state, is_pull_request, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (repo, int(number), issue.get("title"), issue.get("state"), bool(issue.get("is_pull_request")), issue.get("created_at")),
+            ).lastrowid
+            self._db.execute(
+                "INSERT INTO documents_fts (rowid, title, body, comments, labels, authors) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    id,
+                    issue.get("title") or "",
+                    issue.get("body") or "",
+                    "\n\n".join(comment.get("body") or "" for comment in comments),
+                    " ".join(issue.get("labels") or []),
+                    " ".join({issue.get("user") or "", *((comment.get("user") or "") for comment in comments)}),
+                ),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.COMMIT_INTERVAL:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def commit(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def search(self, query: str, repo: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        best matches first. query: fts5 syntax (example: `segfault AND labels:bug`, `"exact phrase"`, `crash*`).
+        repo: "OWNER/NAME" or "OWNER/" (all repos of a owner)
+        """
+        sql: str = """
+            SELECT d.repo, d.number, d.title, d.state, d.is_pull_request, d.created_at,
+                snippet(documents_fts, -1, '[', ']', '...', 12),
+                bm25(documents_fts, 10.0, 3.0, 1.0, 5.0, 2.0) AS rank
+            FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+            WHERE documents_fts MATCH ?
+        """
+        parameters: List[Any] = []
+        if repo is not None:
+            sql += " AND d.repo LIKE ? ESCAPE '\\'"
+            escaped: str = repo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            parameters.append(escaped + "%" if repo.endswith("/") else escaped)
+        sql += " ORDER BY rank LIMIT ?"
+        with self._lock:
+            try:
+                rows: List[Tuple] = self._db.execute(sql, (query, *parameters, limit)).fetchall()
+            except sqlite3.OperationalError:  # not valid fts5 syntax (example: `foo-bar`) -> search the words literally
+                literal: str = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+                rows = self._db.execute(sql, (literal, *parameters, limit)).fetchall()
+        return [
+            {
+                "repo": repo, "number": number, "title": title, "state": state, "is_pull_request": bool(is_pull_request),
+                "created_at": created_at, "snippet": snippet, "score": round(-rank, 3),
+            }
+            for repo, number, title, state, is_pull_request, created_at, snippet, rank in rows
+        ]
+
+
+class PackedIssueStore:
+    """
+    Alternative issue storage: append-only segment files + a offset index instead of one file per issue.
+    (less inodes, faster directory scans, better for rsync, etc)
+
+    every record is compressed on its own (gzip-member / zstd-frame), so a single issue can still be read with one seek.
+    updated issues get appended again and the index points to the newest record -> compact() reclaims the old ones.
+
+    layout: issues/packed/index.json ({number: [segment, offset, length]}) and issues/packed/segment-000001.bin
+    """
+    SEGMENT_SIZE: int = 64 * 1024 * 1024
+    # compact once more than half of the data is superseded
+    COMPACT_RATIO: float = 0.5
+
+    def __init__(self, directory: str, compression: Compression) -> None:
+        self._directory: str = directory
+        self._compression: Compression = compression
+        self._lock: threading.Lock = threading.Lock()
+        makedirs(directory, exist_ok=True)
+        self._index: Dict[str, List[int]] = {}
+        if path.exists(path.join(directory, "index.json")):
+            with open(path.join(directory, "index.json"), "r") as fp:
+                self._index = json.load(fp)
+        segments: List[int] = self._segments()
+        self._segment: int = segments[-1] if segments else 1
+
+    def _segments(self) -> List[int]:
+        return sorted(int(i[8:-4]) for i in listdir(self._directory) if i.startswith("segment-") and i.endswith(".bin"))
+
+    def _segment_file(self, segment: int) -> str:
+        return path.join(self._directory, f"segment-{segment:06}.bin")
+
+    def __contains__(self, number: Union[int, str]) -> bool:
+        return str(number) in self._index
+
+    def numbers(self) -> List[str]:
+        return list(self._index)
+
+    def get(self, number: Union[int, str]) -> Optional[Any]:
+        location: Optional[List[int]] = self._index.get(str(number))
+        if location is None:
+            return None
+        segment, offset, length = location
+        with open(self._segment_file(segment), "rb") as fp:
+            fp.seek(offset)
+            data: bytes = fp.read(length)
+        return json.loads(Compression.decompress(data, self._compression.dictionary))
+
+    def put(self, number: Union[int, str], jsondata: Any) -> None:
+        data: bytes = self._compression.compress(json.dumps(jsondata).encode("utf-8"), use_dictionary=True)
+        with self._lock:
+            if path.exists(self._segment_file(self._segment)) and path.getsize(self._segment_file(self._segment)) >= self.SEGMENT_SIZE:
+                self._segment += 1
+            with open(self._segment_file(self._segment), "ab") as fp:
+                offset: int = fp.tell()
+                fp.write(data)
+            self._index[str(number)] = [self._segment, offset, len(data)]
+        _record(bytes_written=len(data))
+
+    def flush(self) -> None:
+        """
+        persist the index (records appended after the last flush are lost on a crash, but nothing gets corrupted).
+        """
+        with self._lock:
+            with open(path.join(self._directory, "index.json.tmp"), "w") as fp:
+                json.dump(self._index, fp)
+            os.replace(path.join(self._directory, "index.json.tmp"), path.join(self._directory, "index.json"))
+
+    def needs_compaction(self) -> bool:
+        total: int = sum(path.getsize(self._segment_file(i)) for i in self._segments())
+        live: int = sum(length for _, _, length in self._index.values())
+        return total > 0 and (total - live) / total > self.COMPACT_RATIO
+
+    def compact(self) -> None:
+        """rewrites all current records into new segments and deletes the old ones"""
+        self.flush()
+        with self._lock:
+            old_segments: List[int] = self._segments()
+            self._segment = (old_segments[-1] if old_segments else 0) + 1
+        logger.info(f"compacting packed issues ({len(old_segments)} segments)")
+        for number in sorted(self._index, key=int):
+            segment, offset, length = self._index[number]
+            with open(self._segment_file(segment), "rb") as fp:
+                fp.seek(offset)
+                data: bytes = fp.read(length)
+            with self._lock:
+                if path.exists(self._segment_file(self._segment)) and path.getsize(self._segment_file(self._segment)) >= self.SEGMENT_SIZE:
+                    self._segment += 1
+                with open(self._segment_file(self._segment), "ab") as fp:
+                    new_offset: int = fp.tell()
+                    fp.write(data)
+                self._index[number] = [self._segment, new_offset, length]
+        self.flush()  # only delete old segments once nothing points to them anymore
+        for segment in old_segments:
+            os.remove(self._segment_file(segment))
+
+
+class _RateLimitBudget:
+    def __init__(self, auth_token: Optional[str], resource: str) -> None:
+        self.auth_token: Optional[str] = auth_token
+        self.resource: str = resource
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None  # None = unknown (no response yet)
+        self.reset: int = 0
+        self.blocked_until: float = 0  # secondary rate-limit
+        self.secondary_hits: int = 0
+        self.next_request_at: float = 0  # pacing
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token is not None else {}
+
+
+class RateLimitGovernor:
+    """
+    Tracks the remaining rate-limit of every auth-token (per api resource, since rest and graphql are counted separately)
+    based on the response headers and hands out the token with the most budget left.
+    Only once every token is (nearly) exhausted it waits for the earliest reset.
+
+    pace: spread the remaining budget evenly until the reset instead of using it up as fast as possible.
+    """
+
+    def __init__(self, auth_tokens: Optional[List[str]] = None, reserve_rate_limit: int = 0, pace: bool = False) -> None:
+        self._tokens: List[Optional[str]] = list(auth_tokens or []) or [None]
+        self._reserve_rate_limit: int = max(reserve_rate_limit, 0)
+        self._pace: bool = pace
+        self._budgets: Dict[str, List[_RateLimitBudget]] = {}
+        self._last_costs: Dict[str, int] = {}  # resource -> cost of its last request (graphql queries cost more than 1)
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def has_auth_token(self) -> bool:
+        return self._tokens != [None]
+
+    def acquire(self, resource: str = "core", cost: int = 1) -> _RateLimitBudget:
+        """blocks until a token has enough budget left for a request of the given cost"""
+        while True:
+            with self._lock:
+                now: float = time()
+                budgets: List[_RateLimitBudget] = self._budgets.setdefault(resource, [_RateLimitBudget(t, resource) for t in self._tokens])
+                for budget in budgets:
+                    if budget.remaining is not None and budget.reset + 10 < now:  # +10 in case the local clock is off by something
+                        budget.remaining = None  # the window got reset
+                usable: List[_RateLimitBudget] = [
+                    b for b in budgets
+                    if b.blocked_until <= now and (b.remaining is None or b.remaining - cost >= self._reserve_rate_limit)
+                ]
+                if usable:
+                    budget = min(usable, key=lambda b: (b.next_request_at, -(b.remaining if b.remaining is not None else 1 << 30)))
+                    wait: float = budget.next_request_at - now
+                    if wait <= 0:
+                        if budget.remaining is not None:
+                            budget.remaining -= cost  # reserve it for concurrent requests until the response arrives
+                            if self._pace:
+                                budget.next_request_at = now + max(budget.reset - now, 0) / max(budget.remaining - self._reserve_rate_limit, 1)
+                        return budget
+                else:
+                    wait = min(
+                        b.blocked_until if b.remaining is None or b.remaining - cost >= self._reserve_rate_limit else max(b.blocked_until, b.reset + 10)
+                        for b in budgets
+                    ) - now
+                    logger.info(f"Hit ratelimet on all tokens. waiting for reset (~{int(wait) // 60}mins)..")
+            sleep(max(wait, 0.01))
+            _record(rate_limit_sleep_seconds=max(wait, 0.01))
+
+    def update(self, budget: _RateLimitBudget, resp: requests.Response) -> bool:
+        """returns True if the request has been rejected due to a rate-limit and should be retried"""
+        with self._lock:
+            if "X-RateLimit-Remaining" in resp.headers:
+                budget.remaining = int(resp.headers["X-RateLimit-Remaining"] or "0")
+                budget.reset = int(resp.headers.get("X-RateLimit-Reset") or budget.reset)
+                budget.limit = int(resp.headers.get("X-RateLimit-Limit") or budget.limit or 0) or None
+            if resp.status_code not in (403, 429):
+                budget.secondary_hits = 0
+                return False
+            if "Retry-After" in resp.headers:  # secondary rate-limit
+                budget.secondary_hits += 1
+                budget.blocked_until = time() + int(resp.headers["Retry-After"])
+                logger.info(f"Hit secondary ratelimit. waiting {resp.headers['Retry-After']}s..")
+                return True
+            if resp.headers.get("X-RateLimit-Remaining") == "0":  # primary rate-limit exceeded -> data is garbage
+                return True
+            if "secondary rate limit" in resp.text.lower():
+                # no retry-after -> https://docs.github.com/en/rest/using-the-rest-api/best-practices-for-using-the-rest-api
+                budget.secondary_hits += 1
+                budget.blocked_until = time() + 60 * (2 ** min(budget.secondary_hits - 1, 5))
+                logger.info(f"Hit secondary ratelimit. waiting {int(budget.blocked_until - time())}s..")
+                return True
+            return False
+
+    def last_cost(self, resource: str) -> int:
+        with self._lock:
+            return self._last_costs.get(resource, 1)
+
+    def set_last_cost(self, resource: str, cost: int) -> None:
+        with self._lock:
+            self._last_costs[resource] = max(cost, 1)
+
+    def mark_exhausted(self, budget: _RateLimitBudget) -> None:
+        with self._lock:
+            budget.remaining = 0
+
+    def available(self, resource: str = "core") -> Optional[int]:
+        """requests left over all tokens (minus the reserve) until their reset. None = unknown (no response yet or reset passed)"""
+        with self._lock:
+            budgets: List[_RateLimitBudget] = self._budgets.get(resource) or []
+            remaining: List[Optional[int]] = [None if b.reset + 10 < time() else b.remaining for b in budgets]
+            if not budgets or None in remaining:
+                return None
+            return sum(max((r or 0) - self._reserve_rate_limit, 0) for r in remaining)
+
+
+class ResponseCache:
+    """
+    On-disk cache for conditional requests (ETag / Last-Modified).
+    github does not count 304 (not modified) responses against the rate-limit -> unchanged data is free on increments.
+    """
+    # headers needed to use a cached response like a real one (pagination, etc)
+    KEPT_HEADERS: List[str] = ["Content-Type", "Link"]
+
+    def __init__(self, directory: str) -> None:
+        self._directory: str = directory
+        makedirs(directory, exist_ok=True)
+
+    def _file(self, url: str) -> str:
+        return path.join(self._directory, f"{hashlib.sha256(url.encode()).hexdigest()}.json.gz")
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with gzip.open(self._file(url), "rt") as fp:
+                entry: Dict[str, Any] = json.load(fp)
+        except (OSError, ValueError):  # not cached or broken
+            return None
+        return entry if entry.get("url") == url else None
+
+    def store(self, url: str, resp: requests.Response) -> None:
+        if "ETag" not in resp.headers and "Last-Modified" not in resp.headers:
+            return
+        tmp_file: str = f"{self._file(url)}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_file, "wt") as fp:
+            json.dump({
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "headers": {k: resp.headers[k] for k in self.KEPT_HEADERS if k in resp.headers},
+                "body": resp.text,
+            }, fp)
+        os.replace(tmp_file, self._file(url))
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        if entry is None:
+            return {}
+        return {
+            **({"If-None-Match": entry["etag"]} if entry.get("etag") else {}),
+            **({"If-Modified-Since": entry["last_modified"]} if entry.get("last_modified") else {}),
+        }
+
+    @staticmethod
+    def to_response(entry: Dict[str, Any], not_modified: requests.Response) -> requests.Response:
+        """turns a cache-entry into a normal 200 response (with the rate-limit headers of the 304)"""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = entry["url"]
+        resp.request = not_modified.request
+        resp.encoding = "utf-8"
+        resp._content = entry["body"].encode("utf-8")
+        resp.headers = CaseInsensitiveDict({**not_modified.headers, **entry["headers"]})
+        return resp
+
+
+GRAPHQL_URL: str = "https://api.github.com/graphql"
+GRAPHQL_PAGE_SIZE: int = 100
+# https://docs.github.com/en/graphql/reference/enums#reactioncontent
+GRAPHQL_REACTION_NAMES: Dict[str, str] = {
+    "THUMBS_UP": "+1",
+    "THUMBS_DOWN": "-1",
+    "LAUGH": "laugh",
+    "HOORAY": "hooray",
+    "CONFUSED": "confused",
+    "HEART": "heart",
+    "ROCKET": "rocket",
+    "EYES": "eyes",
+}
+GRAPHQL_LOCK_REASONS: Dict[str, str] = {
+    "OFF_TOPIC": "off-topic",
+    "TOO_HEATED": "too heated",
+    "RESOLVED": "resolved",
+    "SPAM": "spam",
+}
+_GRAPHQL_COMMON_FIELDS: str = """
+    number title body state locked activeLockReason createdAt closedAt updatedAt authorAssociation
+    author { login }
+    assignees(first: 100) { nodes { login } }
+    labels(first: 100) { nodes { name } }
+    reactionGroups { content reactors { totalCount } }
+    comments(first: 100) {
+        totalCount
+        pageInfo { hasNextPage }
+        nodes {
+            databaseId authorAssociation body createdAt updatedAt
+            author { login }
+            reactionGroups { content reactors { totalCount } }
+        }
+    }
+"""
+GRAPHQL_ISSUES_QUERY: str = """
+query($owner: String!, $name: String!, $cursor: String, $since: DateTime, $pageSize: Int!) {
+    rateLimit { cost remaining resetAt }
+    repository(owner: $owner, name: $name) {
+        items: issues(first: $pageSize, after: $cursor, filterBy: {since: $since}, orderBy: {field: UPDATED_AT, direction: ASC}) {
+            pageInfo { hasNextPage endCursor }
+            nodes { %s }
+        }
+    }
+}
+""" % _GRAPHQL_COMMON_FIELDS
+# pull-requests can not be filtered by date -> newest first and stop once they are older than the last backup
+GRAPHQL_PULL_REQUESTS_QUERY: str = """
+query($owner: String!, $name: String!, $cursor: String, $pageSize: Int!) {
+    rateLimit { cost remaining resetAt }
+    repository(owner: $owner, name: $name) {
+        items: pullRequests(first: $pageSize, after: $cursor, orderBy: {field: UPDATED_AT, direction: DESC}) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+                %s
+                isDraft merged mergedAt
+                mergedBy { login }
+                mergeCommit { oid }
+                headRefName
+                headRepository { nameWithOwner }
+                baseRefName
+                reviewRequests(first: 100) { nodes { requestedReviewer { ... on User { login } } } }
+            }
+        }
+    }
+}
+""" % _GRAPHQL_COMMON_FIELDS
+
+
+class GitStrategy:
+    """
+    how git mirrors get cloned, fetched, and maintained.
+
+    fetch_jobs: parallel fetches (lfs, submodules, multiple remotes) and pack-index threads
+    filter: partial clone filter (example: "blob:limit=10m"). missing objects are NOT backed up!
+    maintenance_days: repack (with bitmaps) and write a commit-graph if the last maintenance is older (None = never)
+    bundles: write a incremental `git bundle` into DIR-bundles/ after every fetch that changed something
+    """
+
+    def __init__(
+        self,
+        fetch_jobs: int = 1,
+        filter: Optional[str] = None,
+        maintenance_days: Optional[float] = None,
+        bundles: bool = False,
+    ) -> None:
+        self._fetch_jobs: int = max(fetch_jobs or 1, 1)
+        self._filter: Optional[str] = filter
+        self._maintenance_days: Optional[float] = maintenance_days
+        self._bundles: bool = bundles
+
+    @property
+    def _config(self) -> List[str]:
+        return [
+            "-c", "protocol.version=2",
+            "-c", f"fetch.parallel={self._fetch_jobs}",
+            "-c", f"pack.threads={self._fetch_jobs}",
+            "-c", "fetch.writeCommitGraph=true",
+            # a auto-gc in the middle of the backup would only block it -> maintenance() does it
+            "-c", "gc.auto=0",
+            "-c", "maintenance.auto=false",
+        ]
+
+    def clone(self, url: str, directory: str) -> None:
+        subprocess.run(
+            [
+                "git", *self._config, "clone", "--mirror",
+                *([f"--filter={self._filter}"] if self._filter else []),
+                url, directory,
+            ],
+        )
+
+    def fetch(self, directory: str, prune: bool = False) -> None:
+        subprocess.run(
+            ["git", *self._config, "fetch", "--all", *(["--prune"] if prune else [])],
+            cwd=directory,
+        )
+
+    def maintain(self, directory: str) -> None:
+        if self._maintenance_days is None:
+            return
+        last_run: str = subprocess.run(
+            ["git", "config", "--get", "ghrb.lastMaintenance"],
+            cwd=directory, capture_output=True, text=True,
+        ).stdout.strip()
+        if last_run and time() - int(last_run) < self._maintenance_days * 86400:
+            return
+        logger.info(f"repacking {directory} and writing its commit-graph..")
+        # one pack with a bitmap -> fast clones from the mirror (webui git_clone) and no thousands of small packs
+        subprocess.run(["git", "-c", f"pack.threads={self._fetch_jobs}", "repack", "-a", "-d", "--write-bitmap-index", "--quiet"], cwd=directory)
+        subprocess.run(["git", "commit-graph", "write", "--reachable", "--changed-paths"], cwd=directory)
+        subprocess.run(["git", "pack-refs", "--all"], cwd=directory)
+        subprocess.run(["git", "config", "ghrb.lastMaintenance", str(int(time()))], cwd=directory)
+
+    def bundle(self, directory: str) -> None:
+        """
+        every bundle only contains the objects that are new since the last bundle (the first one contains everything).
+        restoring: `git clone FIRST.bundle` and then `git fetch` every following bundle in order.
+        """
+        if not self._bundles:
+            return
+        bundle_dir: str = f"{directory}-bundles"
+        state_file: str = path.join(bundle_dir, "state.json")
+        makedirs(bundle_dir, exist_ok=True)
+        refs: Dict[str, str] = {}
+        for line in subprocess.run(
+            ["git", "for-each-ref", "--format=%(objectname) %(refname)"],
+            cwd=directory, capture_output=True, text=True, check=True,
+        ).stdout.splitlines():
+            sha, ref = line.split(" ", 1)
+            refs[ref] = sha
+        old_refs: Dict[str, str] = {}
+        if path.exists(state_file):
+            with open(state_file, "r") as fp:
+                old_refs = json.load(fp)["refs"]
+        if not refs or refs == old_refs:
+            logger.debug(f"no new git bundle for {directory} (nothing changed)")
+            return
+        # objects of the previous bundle might be gone (force-push + prune + repack)
+        known: List[str] = [
+            sha for sha in set(old_refs.values())
+            if subprocess.run(["git", "cat-file", "-e", f"{sha}^{{commit}}"], cwd=directory, capture_output=True).returncode == 0
+        ]
+        bundle_file: str = path.join(bundle_dir, f"{strftime('%Y%m%dT%H%M%SZ', gmtime())}.bundle")
+        result = subprocess.run(
+            ["git", "bundle", "create", "--quiet", path.abspath(f"{bundle_file}.tmp"), "--all", *(["--not", *known] if known else [])],
+            cwd=directory, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            if path.exists(f"{bundle_file}.tmp"):
+                os.remove(f"{bundle_file}.tmp")
+            if "empty bundle" in result.stderr:  # only deleted / rewound refs
+                logger.debug(f"no new git bundle for {directory} (no new objects)")
+            else:
+                logger.error(f"creating git bundle for {directory} failed: {result.stderr.strip()}")
+                return
+        else:
+            os.replace(f"{bundle_file}.tmp", bundle_file)
+            logger.info(f"wrote git bundle {bundle_file}")
+        with open(f"{state_file}.tmp", "w") as fp:
+            json.dump({"refs": refs}, fp)
+        os.replace(f"{state_file}.tmp", state_file)
+
+
 class GithubRepoBackuper:
     def __init__(
         self,
@@ -67,9 +1326,25 @@ class GithubRepoBackuper:
         include_wiki: bool = False,
         include_projects: bool = False,
         gzip: bool = False,
-        auth_token: Optional[str] = None,
+        compress: Optional[str] = None,
+        zstd_dictionary: bool = False,
+        auth_token: Union[str, List[str], None] = None,
         last_backup: Optional[str] = None,
         reserve_rate_limit: Optional[int] = None,
+        jobs: int = 1,
+        bulk_comments: bool = False,
+        asset_jobs: int = 1,
+        dedup_assets: bool = False,
+        api: str = "rest",
+        pace_rate_limit: bool = False,
+        governor: Optional[RateLimitGovernor] = None,
+        http_cache: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        skip_code: bool = False,
+        issue_storage: str = "files",
+        git_strategy: Optional[GitStrategy] = None,
+        run_stats: Optional[RunStats] = None,
+        search_index: Optional[SearchIndex] = None,
         **_,
     ) -> None:
         assert repo_owner != "" and repo_name != ""
@@ -84,145 +1359,498 @@ class GithubRepoBackuper:
         self._include_releases: bool = include_releases
         self._include_wiki: bool = include_wiki
         self._include_projects: bool = include_projects
-        self._reserve_rate_limit: int = max(reserve_rate_limit or 0, 0)
-        self._gzip = gzip
-        self._github_headers: Dict[str, str] = {
-            **GITHUB_HEADERS,
-            **({"Authorization": f"Bearer {auth_token}"} if auth_token is not None else {}),
-        }
+        self._compression: Compression = Compression(compress or ("gzip" if gzip else "none"))
+        self._train_zstd_dictionary: bool = zstd_dictionary
+        # dictionary trained by a earlier run -> always needed for reading
+        if path.exists(path.join("github", repo_owner, repo_name, "zstd-dictionary.bin")):
+            with open(path.join("github", repo_owner, repo_name, "zstd-dictionary.bin"), "rb") as fp:
+                self._compression.dictionary = fp.read()
+        # compression and writing happen in the background (1 thread -> files get written in order)
+        self._write_pool: Optional[ThreadPoolExecutor] = None
+        self._pending_writes: Deque[Future] = deque()
+        self._pending_writes_lock: threading.Lock = threading.Lock()  # the api and git part can run in parallel (BackupScheduler)
+        self._jobs: int = max(jobs or 1, 1)
+        self._bulk_comments: bool = bulk_comments
+        self._asset_jobs: int = max(asset_jobs or 1, 1)
+        self._blob_store: Optional[BlobStore] = BlobStore(path.join("github", ".blobs")) if dedup_assets else None
+        self._repo_comments: Optional[Dict[int, List[Dict[str, Any]]]] = None
+        self._governor: RateLimitGovernor = governor or RateLimitGovernor(
+            [auth_token] if isinstance(auth_token, str) else auth_token,
+            reserve_rate_limit=max(reserve_rate_limit or 0, 0),
+            pace=pace_rate_limit,
+        )
+        self._response_cache: Optional[ResponseCache] = response_cache or (ResponseCache(path.join("github", ".http-cache")) if http_cache else None)
+        self._skip_code: bool = skip_code
+        self._git_strategy: GitStrategy = git_strategy or GitStrategy()
+        self._run_stats: RunStats = run_stats or RunStats()
+        self._search_index: Optional[SearchIndex] = search_index
+        self.issues_written: int = 0
+        self._issue_store: Optional[PackedIssueStore] = None
+        if issue_storage == "packed" or path.exists(path.join("github", repo_owner, repo_name, "issues", "packed", "index.json")):
+            self._issue_store = PackedIssueStore(path.join("github", repo_owner, repo_name, "issues", "packed"), self._compression)
+        self._api: str = api
+        if self._api == "graphql" and not self._governor.has_auth_token:
+            logger.warning("the graphql api requires a --auth-token -> falling back to the rest api")
+            self._api = "rest"
         environ["GIT_TERMINAL_PROMPT"] = "0"
 
+        # progress of a unfinished backup (phases, pagination, etc) -> a restarted run resumes where it stopped
+        self._checkpoint: Dict[str, Any] = {}
+        self._checkpoint_lock: threading.Lock = threading.Lock()
+        self._issue_index: Dict[str, Dict[str, Any]] = {}
+        self._issue_index_saved_at: float = 0
+
         if path.exists(path.join("github", repo_owner, repo_name, "ghrb.json")):
             logger.debug("found existing ghrb.json")
             with open(path.join("github", repo_owner, repo_name, "ghrb.json"), "r") as fp:
                 ghrb = json.load(fp)
             if last_backup is None:
                 self._last_backup = ghrb.get("last_backup")
+            self._checkpoint = ghrb.get("checkpoint") or {}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self._repo_owner}/{self._repo_name}"
 
     def start_backup(self) -> None:
-        logger.info(f"Starting backup of {self._repo_owner}/{self._repo_name}")
+        self.begin_backup()
+        self._run_phase("issues", self._download_issues)
+        self._run_phase("git", self._download_git)
+        if self._include_releases:
+            self._run_phase("releases", self._download_releases)
+        if self._include_wiki:
+            self._run_phase("wiki", lambda: self._download_git(wiki=True))
+        if self._include_projects:
+            self._run_phase("projects", self._download_projects)
+        self.finish_backup()
+
+    def begin_backup(self) -> None:
+        makedirs(path.join("github", self._repo_owner, self._repo_name), exist_ok=True)
+        if self._checkpoint.get("start_time"):
+            # keep the original start time -> changes during the interrupted run still get picked up next time
+            logger.info(f"Resuming backup of {self.full_name} (done: {', '.join(self._checkpoint.get('completed_phases') or []) or 'nothing'})")
+            self._start_time = self._checkpoint["start_time"]
+            return
+        logger.info(f"Starting backup of {self.full_name}")
         # better duplicate check than no check for a issue on next run
         self._start_time = _datetime_for_github()
-        self._download_issues()
-        self._download_git()
+        self._update_checkpoint(start_time=self._start_time, completed_phases=[])
+
+    def backup_api(self) -> None:
+        """all rate-limited parts of the backup (for BackupScheduler)"""
+        self._run_phase("issues", self._download_issues)
         if self._include_releases:
-            self._download_releases()
-        if self._include_wiki:
-            self._download_git(wiki=True)
+            self._run_phase("releases", self._download_releases)
         if self._include_projects:
-            self._download_projects()
-        with open(path.join("github", self._repo_owner, self._repo_name, "ghrb.json"), "w") as fp:
-            json.dump({
-                "last_backup": self._start_time,
-            }, fp)
+            self._run_phase("projects", self._download_projects)
+
+    def backup_git(self) -> None:
+        """all git parts of the backup (for BackupScheduler)"""
+        self._run_phase("git", self._download_git)
+        if self._include_wiki:
+            self._run_phase("wiki", lambda: self._download_git(wiki=True))
+
+    def finish_backup(self) -> None:
+        self._wait_for_writes()
+        if self._write_pool is not None:
+            self._write_pool.shutdown()
+            self._write_pool = None
+        with self._checkpoint_lock:
+            self._checkpoint = {}
+            self._write_ghrb_json({"last_backup": self._start_time})
+
+    def _run_phase(self, name: str, phase: Callable[[], None]) -> None:
+        if name in (self._checkpoint.get("completed_phases") or []):
+            logger.info(f"skipping {name} (already done before the interruption)")
+            return
+        with self._run_stats.measure(self.full_name, name):
+            phase()
+            self._wait_for_writes()
+        with self._checkpoint_lock:
+            self._checkpoint["completed_phases"] = [*(self._checkpoint.get("completed_phases") or []), name]
+            self._write_ghrb_json({"last_backup": self._last_backup, "checkpoint": self._checkpoint})
+
+    def _update_checkpoint(self, **changes: Any) -> None:
+        self._wait_for_writes()  # the checkpoint must not claim more than is on disk
+        with self._checkpoint_lock:
+            self._checkpoint.update(changes)
+            self._write_ghrb_json({"last_backup": self._last_backup, "checkpoint": self._checkpoint})
+
+    def _write_ghrb_json(self, ghrb: Dict[str, Any]) -> None:
+        ghrb_file: str = path.join("github", self._repo_owner, self._repo_name, "ghrb.json")
+        with open(f"{ghrb_file}.tmp", "w") as fp:
+            json.dump(ghrb, fp)
+        os.replace(f"{ghrb_file}.tmp", ghrb_file)
 
     def _download_issues(self) -> None:
         logger.info("Starting issue backuper")
         makedirs(path.join("github", self._repo_owner, self._repo_name, "issues"), exist_ok=True)
+        self._load_issue_index()
+        if self._search_index is not None and not self._search_index.is_backfilled(self.full_name):
+            if self._issue_index:
+                logger.info(f"adding {len(self._issue_index)} existing issues to the search index")
+            for number in self._issue_index:
+                if (issue := self.read_issue(number)) is not None:
+                    self._search_index.add(self.full_name, number, issue)
+            self._search_index.mark_backfilled(self.full_name)
+        if self._train_zstd_dictionary and self._compression.name == "zstd" and self._compression.dictionary is None:
+            self._create_zstd_dictionary()
+        if self._api == "graphql":
+            self._download_issues_graphql()
+        else:
+            self._download_issues_rest()
+        self._save_issue_index()
+        if self._issue_store is not None and self._issue_store.needs_compaction():
+            self._issue_store.compact()
+
+    def _download_issues_rest(self) -> None:
         next: str = f'https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/issues?per_page=100'
         if self._last_backup is not None:
             next += f"&since={self._last_backup}"
         next += "&state=all"  # open is default
-        for issue in self._gh_paginated(next):
-            logger.debug(f"found issue: {issue['number']}")
-            output_issue: Dict[str, Any] = {
-                "active_lock_reason": issue.get("active_lock_reason"),
-                "assignees": issue.get("assignees"),
-                "author_association": issue.get("author_association"),
-                "body": issue.get("body"),
-                "closed_at": issue.get("closed_at"),
-                "created_at": issue.get("created_at"),
-                "draft": issue.get("draft"),
-                "reactions": _prettify_reactions(issue.get("reactions")),
-                "labels": [i["name"] for i in (issue.get("labels") or []) if "name" in i],
-                "locked": issue.get("locked"),
-                "state": issue.get("state"),
-                "title": issue.get("title"),
-                "user": issue.get("user", {}).get("login"),
-                "comments": (self._get_issue_comments(issue.get("comments_url")) if (issue.get("comments") or 0) > 0 else []),
-                **({
-                    "is_pull_request": True,
-                    "merged_at": issue["pull_request"].get("merged_at"),
-                } if "pull_request" in issue else {"is_pull_request": False}),
+        if self._checkpoint.get("issues_next_url"):
+            next = self._checkpoint["issues_next_url"]
+            logger.info(f"resuming issue download at {next}")
+        # has to be complete before the first issue gets written, since it gets merged into them
+        self._repo_comments = self._get_repo_comments() if self._bulk_comments else None
+        # comments and pr-details are fetched by a worker pool while the pagination continues.
+        # results are written in listing order and the queue is bounded to keep memory in check.
+        # once all issues of a page are written the next page gets checkpointed (None entries mark that).
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            pending: Deque[Tuple[Optional[Future], Optional[str]]] = deque()
+
+            def write_pending(limit: int) -> None:
+                while len(pending) > limit:
+                    future, next_page = pending.popleft()
+                    if future is not None:
+                        self._write_issue(*future.result())
+                    elif next_page is not None:
+                        self._checkpoint_issue_progress(issues_next_url=next_page)
+
+            for issues, next_page in self._gh_paginated_pages(next):
+                for issue in issues:
+                    logger.debug(f"found issue: {issue['number']}")
+                    pending.append((_submit_in_context(executor, self._convert_issue, issue), None))
+                    write_pending(self._jobs * 2)
+                pending.append((None, next_page))
+            write_pending(0)
+
+    def _download_issues_graphql(self) -> None:
+        """same output as the rest variant, but issues get fetched in batches of 100 including their comments, etc"""
+        # the graphql api lists issues and pull-requests separately
+        for node in self._graphql_paginated(GRAPHQL_ISSUES_QUERY, {"since": self._last_backup}, checkpoint_key="issues_graphql_cursor"):
+            logger.debug(f"found issue: {node['number']}")
+            self._write_issue(*self._convert_graphql_issue(node, is_pull_request=False))
+        for node in self._graphql_paginated(GRAPHQL_PULL_REQUESTS_QUERY, {}, checkpoint_key="pull_requests_graphql_cursor"):
+            if self._last_backup is not None and (node.get("updatedAt") or "") < self._last_backup:
+                break
+            logger.debug(f"found pull-request: {node['number']}")
+            self._write_issue(*self._convert_graphql_issue(node, is_pull_request=True))
+
+    def _graphql_paginated(self, query: str, variables: Dict[str, Any], checkpoint_key: str) -> Generator[Any, None, None]:
+        cursor: Optional[str] = self._checkpoint.get(checkpoint_key)
+        page_size: int = GRAPHQL_PAGE_SIZE
+        while True:
+            try:
+                data: Dict[str, Any] = self._gh_graphql(query, {
+                    **variables,
+                    "owner": self._repo_owner,
+                    "name": self._repo_name,
+                    "cursor": cursor,
+                    "pageSize": page_size,
+                })
+            except requests.HTTPError as e:
+                # big pages (with lots of comments) can time out on githubs side -> retry with smaller pages
+                if e.response is None or e.response.status_code not in RETRY_STATUS_CODES or page_size <= 1:
+                    raise
+                page_size = max(page_size // 2, 1)
+                logger.info(f"graphql query failed ({e.response.status_code}) -> retrying with page size {page_size}")
+                continue
+            items: Dict[str, Any] = data["repository"]["items"]
+            yield from items["nodes"]
+            # the consumer processed the whole page
+            if items["pageInfo"]["endCursor"] is not None:
+                self._checkpoint_issue_progress(**{checkpoint_key: items["pageInfo"]["endCursor"]})
+            if not items["pageInfo"]["hasNextPage"]:
+                return
+            cursor = items["pageInfo"]["endCursor"]
+
+    def _convert_graphql_issue(self, node: Dict[str, Any], is_pull_request: bool) -> Tuple[int, Dict[str, Any]]:
+        comments: Dict[str, Any] = node.get("comments") or {}
+        output_issue: Dict[str, Any] = {
+            "active_lock_reason": GRAPHQL_LOCK_REASONS.get(node.get("activeLockReason") or "", node.get("activeLockReason")),
+            "assignees": [{"login": i["login"]} for i in ((node.get("assignees") or {}).get("nodes") or []) if i],
+            "author_association": node.get("authorAssociation"),
+            "body": node.get("body"),
+            "closed_at": node.get("closedAt"),
+            "created_at": node.get("createdAt"),
+            "draft": node.get("isDraft"),
+            "reactions": _prettify_graphql_reactions(node.get("reactionGroups")),
+            "labels": [i["name"] for i in ((node.get("labels") or {}).get("nodes") or []) if i],
+            "locked": node.get("locked"),
+            "state": "open" if node.get("state") == "OPEN" else "closed",
+            "title": node.get("title"),
+            "user": (node.get("author") or {}).get("login"),
+            "comments": (
+                # more than 100 comments -> let the rest-api handle the rest
+                self._collect_issue_comments({
+                    "number": node["number"],
+                    "comments": comments.get("totalCount"),
+                    "comments_url": f"https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/issues/{node['number']}/comments",
+                })
+                if (comments.get("pageInfo") or {}).get("hasNextPage") else
+                [_convert_graphql_comment(i) for i in (comments.get("nodes") or []) if i]
+            ),
+            **({
+                "is_pull_request": True,
+                "merged_at": node.get("mergedAt"),
+            } if is_pull_request else {"is_pull_request": False}),
+        }
+        if self._detailed_prs and is_pull_request:
+            output_issue = {
+                **output_issue,
+                "merge_commit_sha": (node.get("mergeCommit") or {}).get("oid"),
+                "requested_reviewers": [
+                    {"login": i["requestedReviewer"]["login"]}
+                    for i in ((node.get("reviewRequests") or {}).get("nodes") or [])
+                    if i and (i.get("requestedReviewer") or {}).get("login")
+                ],
+                "head": {
+                    "gh_repo": (node.get("headRepository") or {}).get("nameWithOwner"),
+                    "ref": node.get("headRefName"),
+                },
+                "base": node.get("baseRefName"),
+                "merged": node.get("merged"),
+                "merged_by": (node.get("mergedBy") or {}).get("login"),
             }
+        return node["number"], output_issue
 
-            if self._detailed_prs and output_issue["is_pull_request"]:
-                output_issue = {**output_issue, **self._get_pr_details(issue.get("pull_request", {}).get("url"))}
+    def _convert_issue(self, issue: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        output_issue: Dict[str, Any] = {
+            "active_lock_reason": issue.get("active_lock_reason"),
+            "assignees": issue.get("assignees"),
+            "author_association": issue.get("author_association"),
+            "body": issue.get("body"),
+            "closed_at": issue.get("closed_at"),
+            "created_at": issue.get("created_at"),
+            "draft": issue.get("draft"),
+            "reactions": _prettify_reactions(issue.get("reactions")),
+            "labels": [i["name"] for i in (issue.get("labels") or []) if "name" in i],
+            "locked": issue.get("locked"),
+            "state": issue.get("state"),
+            "title": issue.get("title"),
+            "user": issue.get("user", {}).get("login"),
+            "comments": self._collect_issue_comments(issue),
+            **({
+                "is_pull_request": True,
+                "merged_at": issue["pull_request"].get("merged_at"),
+            } if "pull_request" in issue else {"is_pull_request": False}),
+        }
 
-            self.write_gzipable_json(
-                path.join("github", self._repo_owner, self._repo_name, "issues", f"{issue['number']}.json"),
-                output_issue,
-            )
-            # TODO: save user info if new
+        if self._detailed_prs and output_issue["is_pull_request"]:
+            output_issue = {**output_issue, **self._get_pr_details(issue.get("pull_request", {}).get("url"))}
+        return issue["number"], output_issue
+
+    def _write_issue(self, number: int, output_issue: Dict[str, Any]) -> None:
+        issue_file: str = path.join("github", self._repo_owner, self._repo_name, "issues", f"{number}.json")
+        if self._issue_store is not None:
+            self._write_in_background(self._issue_store.put, number, output_issue)
+            for outdated_file in (issue_file, f"{issue_file}.gz", f"{issue_file}.zst"):  # from before switching to the packed storage
+                if path.exists(outdated_file):
+                    os.remove(outdated_file)
+        else:
+            self.write_gzipable_json(issue_file, output_issue, use_dictionary=True)
+        self._issue_index[str(number)] = _issue_summary(output_issue)
+        self.issues_written += 1
+        if self._search_index is not None:
+            self._write_in_background(self._search_index.add, self.full_name, number, output_issue)
+        # TODO: save user info if new
+
+    def _load_issue_index(self) -> None:
+        """
+        issues-index.json contains the data needed for issue lists (state, title, labels, etc) of all issues
+        -> readers (webui, scripts) dont have to open every single issue
+        """
+        self._issue_index = self.read_gzipable_json(path.join("github", self._repo_owner, self._repo_name, "issues-index.json")) or {}
+        if self._issue_index:
+            return
+        # backup from before the index existed
+        issue_dir: str = path.join("github", self._repo_owner, self._repo_name, "issues")
+        numbers: List[str] = [i.split(".", 1)[0] for i in listdir(issue_dir)] + (self._issue_store.numbers() if self._issue_store is not None else [])
+        for number in sorted(set(numbers)):
+            if not number.isdigit():
+                continue
+            issue: Optional[Dict[str, Any]] = self.read_issue(number)
+            if issue is not None:
+                self._issue_index[number] = _issue_summary(issue)
+        if self._issue_index:
+            logger.info(f"created issue index from {len(self._issue_index)} existing issues")
+
+    def _create_zstd_dictionary(self) -> None:
+        """
+        trains a zstd dictionary from the already backed up issues (including comments).
+        it is never replaced afterwards, since existing files can only be read with it.
+        """
+        samples: List[bytes] = []
+        for number in list(self._issue_index)[-ZSTD_DICTIONARY_MAX_SAMPLES:]:
+            issue: Optional[Dict[str, Any]] = self.read_issue(number)
+            if issue is not None:
+                samples.append(json.dumps(issue).encode("utf-8"))
+        if len(samples) < 100:  # training on to few samples is pointless (and fails)
+            logger.info(f"not enough issues to train a zstd dictionary yet ({len(samples)})")
+            return
+        logger.info(f"training zstd dictionary from {len(samples)} issues")
+        dictionary: bytes = zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+        dictionary_file: str = path.join("github", self._repo_owner, self._repo_name, "zstd-dictionary.bin")
+        with open(f"{dictionary_file}.tmp", "wb") as fp:
+            fp.write(dictionary)
+        os.replace(f"{dictionary_file}.tmp", dictionary_file)
+        self._compression.dictionary = dictionary
+
+    def read_issue(self, number: Union[int, str]) -> Optional[Dict[str, Any]]:
+        """reads a backed up issue independent of the storage format"""
+        if self._issue_store is not None and number in self._issue_store:
+            return self._issue_store.get(number)
+        return self.read_gzipable_json(path.join("github", self._repo_owner, self._repo_name, "issues", f"{number}.json"))
+
+    def _save_issue_index(self) -> None:
+        self._wait_for_writes()
+        if self._issue_store is not None:
+            self._issue_store.flush()
+        if self._search_index is not None:
+            self._search_index.commit()
+        self.write_gzipable_json(path.join("github", self._repo_owner, self._repo_name, "issues-index.json"), self._issue_index)
+        self._issue_index_saved_at = time()
+
+    def _checkpoint_issue_progress(self, **changes: Any) -> None:
+        """the issue-index has to be saved with the checkpoint, since a resumed run wont download those issues again"""
+        if time() - self._issue_index_saved_at < ISSUE_INDEX_SAVE_INTERVAL:
+            return
+        self._save_issue_index()
+        self._update_checkpoint(**changes)
 
     def _download_git(self, wiki: bool = False) -> None:
+        if self._skip_code and not wiki:
+            logger.info("skipping git (no push since the last backup)")
+            return
         logger.info("backing up git..")
         dirname: str = "wiki" if wiki else "git"
-        if path.exists(path.join("github", self._repo_owner, self._repo_name, dirname)):
+        git_dir: str = path.join(path.curdir, "github", self._repo_owner, self._repo_name, dirname)
+        if path.exists(git_dir):
             logger.info(f"incremental {'wiki ' if wiki else ''}git backup using fetch..")
-            subprocess.run(
-                ["git", "fetch", "--all", *(["--prune"] if self._do_prune else [])],
-                cwd=path.join(path.curdir, "github", self._repo_owner, self._repo_name, dirname),
-            )
+            self._git_strategy.fetch(git_dir, prune=self._do_prune)
         else:
             logger.info(f"initial {'wiki ' if wiki else ''}git backup using clone..")
-            subprocess.run(
-                [
-                    "git", "clone", "--mirror",
-                    f"https://github.com/{self._repo_owner}/{self._repo_name}{'.wiki' if wiki else ''}.git",
-                    dirname
-                ],
-                cwd=path.join(path.curdir, "github", self._repo_owner, self._repo_name),
+            self._git_strategy.clone(
+                f"https://github.com/{self._repo_owner}/{self._repo_name}{'.wiki' if wiki else ''}.git",
+                git_dir,
             )
         if self._include_lfs:
             logger.info(f"downloading {'wiki ' if wiki else ''}git-lfs")
             subprocess.run(
                 ["git", "lfs", "fetch", "--all"],
-                cwd=path.join(path.curdir, "github", self._repo_owner, self._repo_name, dirname),
+                cwd=git_dir,
             )
+        if path.exists(git_dir):  # the clone fails for repos without a wiki
+            self._git_strategy.maintain(git_dir)
+            self._git_strategy.bundle(git_dir)
 
     def _download_releases(self) -> None:
         logger.info("Downloading releases")
         makedirs(path.join("github", self._repo_owner, self._repo_name, "releases"), exist_ok=True)
-        # 100 per page is limit and the rate-limit counts requests, not requested data amount
-        for release in self._gh_paginated(f'https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/releases?per_page=100'):
-            id: int = release["id"]
-            output_release: Dict[str, Any] = {
-                "tag_name": release.get("tag_name"),
-                "name": release.get("name"),
-                "is_draft": release.get("draft"),
-                "is_prerelease": release.get("prerelease"),
-                "created_at": release.get("created_at"),
-                "published_at": release.get("published_at"),
-                "body": release.get("body"),
-                "reactions": _prettify_reactions(release.get("reactions")),
-                "assets": [
-                    {
-                        "content_type": asset.get("content_type"),
-                        "download_count": asset.get("download_count"),
-                        "name": asset.get("name"),
-                    } for asset in (release.get("assets") or [])
-                ]
-            }
-            dir = path.join("github", self._repo_owner, self._repo_name, "releases", str(id))
-            if path.exists(dir):
+        # assets of multiple releases get downloaded at once. releases are finished (release.json + checkpoint) in order.
+        pending: Deque[Tuple[int, str, Dict[str, Any], List[Future]]] = deque()
+
+        def finish_releases(limit: int) -> None:
+            while len(pending) > limit:
+                id, dir, output_release, assets = pending.popleft()
+                for asset in assets:
+                    asset.result()
+                self.write_gzipable_json(path.join(dir, "release.json"), output_release)
+                self._update_checkpoint(finished_releases=[*(self._checkpoint.get("finished_releases") or []), id])
+
+        with ThreadPoolExecutor(max_workers=self._asset_jobs, thread_name_prefix="ghrb-asset") as asset_pool:
+            # 100 per page is limit and the rate-limit counts requests, not requested data amount
+            for release in self._gh_paginated(f'https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/releases?per_page=100', cached=True):
+                id: int = release["id"]
+                output_release: Dict[str, Any] = {
+                    "tag_name": release.get("tag_name"),
+                    "name": release.get("name"),
+                    "is_draft": release.get("draft"),
+                    "is_prerelease": release.get("prerelease"),
+                    "created_at": release.get("created_at"),
+                    "published_at": release.get("published_at"),
+                    "body": release.get("body"),
+                    "reactions": _prettify_reactions(release.get("reactions")),
+                    "assets": [
+                        {
+                            "content_type": asset.get("content_type"),
+                            "download_count": asset.get("download_count"),
+                            "name": asset.get("name"),
+                            "size": asset.get("size"),
+                            "digest": asset.get("digest"),
+                        } for asset in (release.get("assets") or [])
+                    ]
+                }
+                dir = path.join("github", self._repo_owner, self._repo_name, "releases", str(id))
+                # release.json gets written last -> a release without it got interrupted and is incomplete
+                if id in (self._checkpoint.get("finished_releases") or []) or self._is_release_complete(dir, release):
+                    continue
+                makedirs(dir, exist_ok=True)
+                pending.append((id, dir, output_release, [
+                    _submit_in_context(asset_pool, self._download_asset, dir, asset) for asset in (release.get("assets") or [])
+                ]))
+                finish_releases(self._asset_jobs)
+            finish_releases(0)
+
+    def _is_release_complete(self, dir: str, release: Dict[str, Any]) -> bool:
+        stored_release: Optional[Dict[str, Any]] = self.read_gzipable_json(path.join(dir, "release.json"))
+        if stored_release is None:
+            return False
+        if all("size" in asset for asset in stored_release.get("assets") or []):
+            return True
+        # written by a older version (release.json before the assets, no verification) -> check the assets once
+        complete: bool = True
+        for asset in release.get("assets") or []:
+            if path.exists(path.join(dir, f"{asset['name']}.gz")):
+                continue  # the size of compressed files says nothing
+            local_file: str = path.join(dir, asset["name"])
+            if path.exists(local_file) and (asset.get("size") is None or path.getsize(local_file) == asset["size"]):
                 continue
-            makedirs(dir, exist_ok=True)
-            self.write_gzipable_json(path.join(dir, "release.json"), output_release)
-            for asset in release.get("assets", []):
-                gz: bool = (
-                    self._gzip
-                    and asset["content_type"] not in ALREADY_COMPRESSED_CONTENT_TYPES
-                    and asset['name'].rsplit(".", 1)[-1].lower() not in ALREADY_COMPRESSED_FILE_EXTENSIONS
-                )
-                _download_file(
-                    asset["browser_download_url"],
-                    path.join(dir, f"{asset['name']}.gz" if gz else asset["name"]),
-                    gz
-                )
+            if path.exists(local_file):
+                logger.info(f"{local_file} is incomplete (interrupted download of a older version) -> downloading it again")
+                os.remove(local_file)  # _download_file keeps existing files
+            complete = False
+        return complete
+
+    def _download_asset(self, dir: str, asset: Dict[str, Any]) -> None:
+        compress: bool = (
+            self._compression.enabled
+            and asset["content_type"] not in ALREADY_COMPRESSED_CONTENT_TYPES
+            and asset['name'].rsplit(".", 1)[-1].lower() not in ALREADY_COMPRESSED_FILE_EXTENSIONS
+        )
+        extension: str = self._compression.extension if compress else ""
+        local_file: str = path.join(dir, f"{asset['name']}{extension}")
+        digest: Optional[str] = asset.get("digest")
+        if self._blob_store is not None and digest is not None and digest.startswith("sha256:"):
+            blob: str = self._blob_store.blob_path(digest[7:], extension)
+            # compressed blobs have a different size, but the hash is the one of the content anyway
+            if path.exists(blob) and (compress or asset.get("size") is None or path.getsize(blob) == asset["size"]):
+                logger.debug(f"{asset['name']} is already in the blob-store -> linking it")
+                self._blob_store.link(blob, local_file)
+                return
+        sha256: Optional[str] = _download_file(
+            asset["browser_download_url"],
+            local_file,
+            self._compression if compress else None,
+            size=asset.get("size"),
+            digest=digest,
+        )
+        if self._blob_store is not None and sha256 is not None:
+            self._blob_store.add(local_file, sha256, extension)
 
     def _download_projects(self) -> None:
-        response: requests.Response = self._gh_get(f"https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/projects?per_page=100")
+        response: requests.Response = self._gh_get(f"https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/projects?per_page=100", cached=True)
         if response.status_code in (401, 410):
             logger.warning("Failed to get repository projects (missing permission)")
             return
@@ -235,13 +1863,13 @@ class GithubRepoBackuper:
         dir: str = path.join("github", self._repo_owner, self._repo_name, "projects")
         makedirs(dir, exist_ok=True)
         for project in response_json:
-            columns_response: requests.Response = self._gh_get(project["columns_url"])
+            columns_response: requests.Response = self._gh_get(project["columns_url"], cached=True)
             columns_response.raise_for_status()
             columns: List = columns_response.json()
             assert isinstance(columns, list)
             out_cols: List[Any] = []
             for column in columns:
-                cards_response: requests.Response = self._gh_get(column["cards_url"])
+                cards_response: requests.Response = self._gh_get(column["cards_url"], cached=True)
                 cards_response.raise_for_status()
                 cards: List = cards_response.json()
                 assert isinstance(cards, list)
@@ -269,19 +1897,71 @@ class GithubRepoBackuper:
                 "creator": (project.get("creator") or {}).get("login"),
             })
 
-    def write_gzipable_json(self, filepath: str, jsondata: Any) -> None:
-        if self._gzip:
-            with gzip.open(f"{filepath}.gz", "wt") as fp:
-                json.dump(jsondata, fp)
-        else:
-            with open(filepath, "w") as fp:
-                json.dump(jsondata, fp)
+    def write_gzipable_json(self, filepath: str, jsondata: Any, use_dictionary: bool = False) -> None:
+        """
+        compresses (if enabled) and writes the file in the background (see _wait_for_writes).
+        use_dictionary: compress with the repos zstd dictionary (only for issues, since it is trained on them)
+        """
+        self._write_in_background(self._write_json_file, filepath, jsondata, use_dictionary)
+
+    def _write_json_file(self, filepath: str, jsondata: Any, use_dictionary: bool) -> None:
+        target: str = f"{filepath}{self._compression.extension}"
+        # written to a temporary file first -> a killed process never leaves a truncated file behind
+        data: bytes = self._compression.compress(json.dumps(jsondata).encode("utf-8"), use_dictionary=use_dictionary)
+        with open(f"{target}.tmp", "wb") as fp:
+            fp.write(data)
+        os.replace(f"{target}.tmp", target)
+        _record(bytes_written=len(data), files_written=1)
+        # the compression got changed since the last backup -> dont leave a outdated version behind
+        for outdated in (filepath, f"{filepath}.gz", f"{filepath}.zst"):
+            if outdated != target and path.exists(outdated):
+                os.remove(outdated)
 
-    def _gh_get(self, url: str) -> requests.Response:
-        return _gh_get(url=url, headers=self._github_headers, reserve_rate_limit=self._reserve_rate_limit)
+    def _write_in_background(self, function: Callable[..., None], *args: Any) -> None:
+        if self._write_pool is None:
+            self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ghrb-write")
+        with self._pending_writes_lock:
+            self._pending_writes.append(_submit_in_context(self._write_pool, function, *args))
+            oldest: Optional[Future] = self._pending_writes[0] if len(self._pending_writes) > 256 else None
+        if oldest is not None:  # dont buffer to much if compression is slower than the network
+            oldest.result()
+            self._prune_writes()
 
-    def _gh_paginated(self, initial_url: str) -> Generator[Any, None, None]:
-        yield from _gh_paginated(initial_url, headers=self._github_headers, reserve_rate_limit=self._reserve_rate_limit)
+    def _wait_for_writes(self) -> None:
+        """blocks until everything written before the call is on disk (raises errors of the writes)"""
+        # a snapshot instead of popping -> a other thread waiting for the same writes can not make this one return early
+        with self._pending_writes_lock:
+            pending: List[Future] = list(self._pending_writes)
+        for future in pending:
+            future.result()
+        self._prune_writes()
+
+    def _prune_writes(self) -> None:
+        """forgets finished writes (failed ones stay, so every waiter gets their error)"""
+        with self._pending_writes_lock:
+            while self._pending_writes and self._pending_writes[0].done() and self._pending_writes[0].exception() is None:
+                self._pending_writes.popleft()
+
+    def read_gzipable_json(self, filepath: str) -> Optional[Any]:
+        """reads a file written by write_gzipable_json (independent of the current --compress setting)"""
+        for candidate in (filepath, f"{filepath}.gz", f"{filepath}.zst"):
+            if not path.exists(candidate):
+                continue
+            with open(candidate, "rb") as fp:
+                return json.loads(Compression.decompress(fp.read(), self._compression.dictionary))
+        return None
+
+    def _gh_get(self, url: str, cached: bool = False) -> requests.Response:
+        return _gh_get(url=url, governor=self._governor, cache=self._response_cache if cached else None)
+
+    def _gh_graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        return _gh_graphql(query, variables, governor=self._governor)
+
+    def _gh_paginated(self, initial_url: str, cached: bool = False) -> Generator[Any, None, None]:
+        yield from _gh_paginated(initial_url, governor=self._governor, cache=self._response_cache if cached else None)
+
+    def _gh_paginated_pages(self, initial_url: str) -> Generator[Tuple[Iterator[Any], Optional[str]], None, None]:
+        yield from _gh_paginated_pages(initial_url, governor=self._governor)
 
     def _get_pr_details(self, url: Optional[str]) -> Dict[str, Any]:
         if url is None:
@@ -305,35 +1985,177 @@ class GithubRepoBackuper:
     def _get_issue_comments(self, url: Optional[str]) -> List[Dict[str, Any]]:
         if url is None:
             return []
-        output: List[Dict[str, Any]] = []
-        resp = self._gh_get(url)
-        resp.raise_for_status()  # TODO: handle
-        for comment in resp.json():
-            output.append({
-                "author_association": comment.get("author_association"),
-                "body": comment.get("body"),
-                "created_at": comment.get("created_at"),
-                "updated_at": comment.get("updated_at"),
-                "reactions": _prettify_reactions(comment.get("reactions")),
-                "user": (comment.get("user") or {}).get("login"),
-            })
+        return [_convert_comment(comment) for comment in self._gh_paginated(f"{url}?per_page=100")]
+
+    def _get_repo_comments(self) -> Dict[int, List[Dict[str, Any]]]:
+        """all (since last backup updated) comments of the repo grouped by issue number"""
+        logger.info("Downloading repo-wide issue comments")
+        url: str = f"https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/issues/comments?per_page=100&sort=created&direction=asc"
+        if self._last_backup is not None:
+            url += f"&since={self._last_backup}"
+        output: Dict[int, List[Dict[str, Any]]] = {}
+        for comment in self._gh_paginated(url):
+            try:
+                number: int = int(comment["issue_url"].rsplit("/", 1)[-1])
+            except (KeyError, AttributeError, ValueError):
+                continue
+            output.setdefault(number, []).append(_convert_comment(comment))
         return output
 
+    def _collect_issue_comments(self, issue: Dict[str, Any]) -> List[Dict[str, Any]]:
+        count: int = issue.get("comments") or 0
+        if count == 0:
+            return []
+        if self._repo_comments is not None:
+            new: List[Dict[str, Any]] = self._repo_comments.get(issue["number"], [])
+            merged: List[Dict[str, Any]] = new
+            if self._last_backup is not None:
+                # only changed comments got listed -> merge them into the previous backup of the issue
+                new_ids = {comment["id"] for comment in new}
+                old: List[Dict[str, Any]] = (self.read_issue(issue["number"]) or {}).get("comments") or []
+                merged = sorted(
+                    [comment for comment in old if comment.get("id") not in new_ids] + new,
+                    key=lambda comment: comment.get("created_at") or "",
+                )
+            # old backups did not store comment ids and comments could have been deleted or added in the meantime
+            if len(merged) == count and all(comment.get("id") is not None for comment in merged):
+                return merged
+            logger.debug(f"bulk comments of issue {issue['number']} are incomplete ({len(merged)}/{count}) -> fetching them individually")
+        return self._get_issue_comments(issue.get("comments_url"))
+
 
-def _gh_get(url: str, headers: Dict[str, str], reserve_rate_limit: int = 0) -> requests.Response:
+def _gh_get(url: str, governor: RateLimitGovernor, cache: Optional[ResponseCache] = None) -> requests.Response:
+    cached: Optional[Dict[str, Any]] = cache.lookup(url) if cache is not None else None
     while True:
+        budget: _RateLimitBudget = governor.acquire()
         logger.debug(f"HTTP GET {url}")
-        resp = requests.get(url, headers=headers)
-        if int(resp.headers["X-RateLimit-Remaining"] or "0") <= reserve_rate_limit:
-            # +10 in case the local clock is off by something
-            sleep_seconds: int = int(resp.headers["X-RateLimit-Reset"]) - floor(time()) + 10
-            logger.info(f"Hit ratelimet. waiting for reset (~{sleep_seconds // 60}mins)..")
-            sleep(sleep_seconds)
-            if resp.status_code in (403, 428):  # exceeded -> data is garbage (otherwise just reached)
-                continue
+        resp = _get_http_session().get(url, headers={**GITHUB_HEADERS, **budget.headers, **ResponseCache.conditional_headers(cached)})
+        # 304 (not modified) responses are free
+        _record(requests=1, rate_limit_units=0 if resp.status_code == 304 else 1, bytes_downloaded=len(resp.content))
+        if governor.update(budget, resp):
+            continue
+        if cached is not None and resp.status_code == 304:
+            logger.debug(f"not modified: {url}")
+            return ResponseCache.to_response(cached, resp)
+        if cache is not None and resp.status_code == 200:
+            cache.store(url, resp)
         return resp
 
 
+def _gh_graphql(query: str, variables: Dict[str, Any], governor: RateLimitGovernor) -> Dict[str, Any]:
+    """
+    graphql has a point based rate-limit (cost depends on the query) -> the cost of the last query is used
+    to decide whether the next one still fits into the remaining budget of a token.
+    """
+    while True:
+        # kept in the governor -> the queries of all repos and threads share it
+        budget: _RateLimitBudget = governor.acquire("graphql", cost=governor.last_cost("graphql"))
+        logger.debug(f"HTTP POST {GRAPHQL_URL}")
+        resp: requests.Response = _get_http_session().post(GRAPHQL_URL, headers={**GITHUB_HEADERS, **budget.headers}, json={"query": query, "variables": variables})
+        _record(requests=1, bytes_downloaded=len(resp.content))
+        if governor.update(budget, resp):
+            continue
+        resp.raise_for_status()
+        body: Dict[str, Any] = resp.json()
+        if any((error.get("type") == "RATE_LIMITED") for error in (body.get("errors") or [])):
+            governor.mark_exhausted(budget)
+            continue
+        if body.get("errors"):
+            raise RuntimeError(f"graphql query failed: {body['errors']}")
+        cost: int = max(((body["data"].get("rateLimit") or {}).get("cost") or 1), 1)
+        governor.set_last_cost("graphql", cost)
+        _record(rate_limit_units=cost)
+        return body["data"]
+
+
+def _convert_graphql_comment(comment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": comment.get("databaseId"),
+        "author_association": comment.get("authorAssociation"),
+        "body": comment.get("body"),
+        "created_at": comment.get("createdAt"),
+        "updated_at": comment.get("updatedAt"),
+        "reactions": _prettify_graphql_reactions(comment.get("reactionGroups")),
+        "user": (comment.get("author") or {}).get("login"),
+    }
+
+
+def _prettify_graphql_reactions(reaction_groups: Optional[List[Dict[str, Any]]]) -> Dict[str, int]:
+    """same format as _prettify_reactions"""
+    return {
+        GRAPHQL_REACTION_NAMES.get(group["content"], group["content"].lower()): group["reactors"]["totalCount"]
+        for group in (reaction_groups or [])
+        if ((group.get("reactors") or {}).get("totalCount") or 0) > 0
+    }
+
+
+def _issue_summary(issue: Dict[str, Any]) -> Dict[str, Any]:
+    """the issue-index entry of a issue"""
+    return {
+        "title": issue.get("title"),
+        "state": issue.get("state"),
+        "is_pull_request": issue.get("is_pull_request"),
+        "labels": issue.get("labels") or [],
+        "user": issue.get("user"),
+        "comments": len(issue.get("comments") or []),
+        "created_at": issue.get("created_at"),
+        "closed_at": issue.get("closed_at"),
+    }
+
+
+def _read_last_backup(repo_owner: str, repo_name: str) -> Optional[str]:
+    try:
+        with open(path.join("github", repo_owner, repo_name, "ghrb.json"), "r") as fp:
+            return json.load(fp).get("last_backup")
+    except (OSError, ValueError):
+        return None
+
+
+def _write_owner_manifest(repo_owner: str, repos: List[Dict[str, Any]]) -> None:
+    """overview of all repos of a owner (hidden file -> not listed as repo by the webui)"""
+    makedirs(path.join("github", repo_owner), exist_ok=True)
+    manifest_file: str = path.join("github", repo_owner, ".ghrb-repos.json")
+    with open(f"{manifest_file}.tmp", "w") as fp:
+        json.dump({
+            repo["name"]: {
+                "fork": repo.get("fork"),
+                "archived": repo.get("archived"),
+                "pushed_at": repo.get("pushed_at"),
+                "updated_at": repo.get("updated_at"),
+                "last_backup": _read_last_backup(repo_owner, repo["name"]),
+            } for repo in repos
+        }, fp, indent=1)
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+
+
+def _repo_activity(repo_owner: str, repo: Dict[str, Any], governor: RateLimitGovernor) -> str:
+    """
+    what changed since the last backup: "all" (or unknown), "issues" (no push, but issue/pr activity), or "none".
+    the repos updated_at does not change with issue activity -> 1 cheap request checks for updated issues.
+    """
+    last_backup: Optional[str] = _read_last_backup(repo_owner, repo["name"])
+    if last_backup is None or (repo.get("pushed_at") or "9") > last_backup or (repo.get("updated_at") or "9") > last_backup:
+        return "all"
+    resp: requests.Response = _gh_get(
+        f"https://api.github.com/repos/{repo_owner}/{repo['name']}/issues?per_page=1&state=all&since={last_backup}",
+        governor=governor,
+    )
+    resp.raise_for_status()
+    return "issues" if resp.json() else "none"
+
+
+def _convert_comment(comment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": comment.get("id"),
+        "author_association": comment.get("author_association"),
+        "body": comment.get("body"),
+        "created_at": comment.get("created_at"),
+        "updated_at": comment.get("updated_at"),
+        "reactions": _prettify_reactions(comment.get("reactions")),
+        "user": (comment.get("user") or {}).get("login"),
+    }
+
+
 def _prettify_reactions(reactions: Optional[Dict[str, Any]]) -> Dict[str, int]:
     """drops api-urls, and redundant info"""
     if not isinstance(reactions, dict):
@@ -345,39 +2167,187 @@ def _datetime_for_github() -> str:
     return strftime("%Y-%m-%dT%H:%M:%SZ", gmtime())
 
 
-def _download_file(url: str, local_file: str, gzip_result: bool = False) -> None:
+def _download_file(
+    url: str,
+    local_file: str,
+    compression: Optional[Compression] = None,
+    size: Optional[int] = None,
+    digest: Optional[str] = None,
+) -> Optional[str]:
     """
-    gzip_result will just gzip the result without questions.
+    compression will just compress the result without questions.
         change the filename and check for duplicate compression at the other end.
+
+    the (uncompressed) download goes to LOCAL_FILE.part and gets resumed (http range) if it already exists.
+    size and digest ("sha256:HEX", as provided by the github api) get verified before the file is moved into place.
+
+    returns the sha256 of the (uncompressed) content (None if the file already existed).
     """
-    # https://stackoverflow.com/a/16696317
-    logger.debug(f"Downloading {url} to {local_file}")
-    with requests.get(url, stream=True) as r:
+    if path.exists(local_file):  # only ever created after a successful verification
+        return None
+    part_file: str = f"{local_file}.part"
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        try:
+            _download_part_file(url, part_file, size)
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout) as e:
+            if attempt == DOWNLOAD_ATTEMPTS:
+                raise
+            logger.info(f"Download of {url} failed ({e!r}) -> resuming (attempt {attempt + 1} / {DOWNLOAD_ATTEMPTS})")
+            sleep(2 ** attempt)
+
+    actual_size: int = path.getsize(part_file)
+    if size is not None and actual_size != size:
+        os.remove(part_file)
+        raise IOError(f"Download of {url} has the wrong size ({actual_size} instead of {size})")
+    actual_digest: str = _sha256_file(part_file)
+    if digest is not None and digest.startswith("sha256:") and actual_digest != digest[7:]:
+        os.remove(part_file)
+        raise IOError(f"Download of {url} has the wrong checksum (sha256:{actual_digest} instead of {digest})")
+
+    if compression is None:
+        os.replace(part_file, local_file)
+        _record(files_written=1)
+        return actual_digest
+    with open(part_file, "rb") as src, open(f"{local_file}.tmp", "wb") as f:
+        with compression.stream_writer(f) as fp:
+            while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
+    os.replace(f"{local_file}.tmp", local_file)
+    _record(files_written=1, bytes_written=path.getsize(local_file))
+    os.remove(part_file)
+    return actual_digest
+
+
+def _download_part_file(url: str, part_file: str, size: Optional[int]) -> None:
+    offset: int = path.getsize(part_file) if path.exists(part_file) else 0
+    if size is not None and offset >= size:
+        return  # already complete (or broken -> caught by the size check)
+    logger.debug(f"Downloading {url} to {part_file}" + (f" (resuming at {offset} bytes)" if offset else ""))
+    _record(requests=1)
+    with _get_http_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT, headers={"Range": f"bytes={offset}-"} if offset else {}) as r:
+        if r.status_code == 416:  # range not satisfiable -> the part file is broken
+            os.remove(part_file)
+            raise requests.ConnectionError(f"invalid partial download of {url}")
         r.raise_for_status()  # TODO: handle
-        if gzip_result:
-            with gzip.open(local_file, "wb") as fp:
-                for chunk in r.iter_content(chunk_size=8192):
-                    fp.write(chunk)
-        else:
-            with open(local_file, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        # 200 instead of 206 -> the server does not support ranges -> start from scratch
+        with open(part_file, "ab" if r.status_code == 206 else "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                _record(bytes_downloaded=len(chunk), bytes_written=len(chunk))
 
 
-def _gh_paginated(initial_url: str, headers: Dict[str, str], reserve_rate_limit: int = 0) -> Generator[Any, None, None]:
-    next: Optional[str] = initial_url
-    while next is not None:
-        resp: requests.Response = _gh_get(next, headers=headers, reserve_rate_limit=reserve_rate_limit)
-        resp.raise_for_status()
-        yield from resp.json()
-        next = None
+def _sha256_file(filepath: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        while chunk := fp.read(DOWNLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _gh_paginated(initial_url: str, governor: RateLimitGovernor, cache: Optional[ResponseCache] = None) -> Generator[Any, None, None]:
+    for items, _ in _gh_paginated_pages(initial_url, governor=governor, cache=cache):
+        yield from items
+
+
+def _gh_paginated_pages(
+    initial_url: str,
+    governor: RateLimitGovernor,
+    cache: Optional[ResponseCache] = None,
+    prefetch: int = PAGINATION_PREFETCH,
+) -> Generator[Tuple[Iterator[Any], Optional[str]], None, None]:
+    """
+    yields (items of the page, url of the next page).
+    while a page gets processed the following ones (up to PREFETCH) get fetched in the background.
+    the items of a page get decoded one by one when they are needed.
+    """
+    resp: requests.Response = _gh_get_page(initial_url, governor, cache)
+    next: Optional[str] = _next_page_url(resp)
+    if next is None or prefetch <= 0:  # single page lists (most comment lists) dont need a thread
+        yield _iter_json_array(resp), next
+        while next is not None:
+            resp = _gh_get_page(next, governor, cache)
+            next = _next_page_url(resp)
+            yield _iter_json_array(resp), next
+        return
+
+    pages: queue.Queue = queue.Queue(maxsize=prefetch)
+    stop: threading.Event = threading.Event()
+
+    def offer(page: Tuple[Any, Optional[str]]) -> None:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def fetch_pages(url: Optional[str]) -> None:
         try:
-            for link_str in resp.headers["Link"].split(", "):
-                url, rel = link_str.split("; rel=", 1)
-                if rel == '"next"':
-                    next = url[1:-1]  # cut < and >
-        except Exception:  # key error, not a string, etc -> does not contain next
+            while url is not None and not stop.is_set():
+                page: requests.Response = _gh_get_page(url, governor, cache)
+                url = _next_page_url(page)
+                offer((page, url))
+            offer((None, None))
+        except BaseException as e:
+            offer((e, None))
+
+    # the copied context -> requests still count towards the current phase
+    threading.Thread(target=contextvars.copy_context().run, args=(fetch_pages, next), name="ghrb-prefetch", daemon=True).start()
+    try:
+        yield _iter_json_array(resp), next
+        while True:
+            page, next = pages.get()
+            if page is None:
+                return
+            if isinstance(page, BaseException):
+                raise page
+            yield _iter_json_array(page), next
+    finally:  # also if the consumer stops early (GeneratorExit)
+        stop.set()
+
+
+def _gh_get_page(url: str, governor: RateLimitGovernor, cache: Optional[ResponseCache]) -> requests.Response:
+    resp: requests.Response = _gh_get(url, governor=governor, cache=cache)
+    resp.raise_for_status()
+    return resp
+
+
+def _iter_json_array(resp: requests.Response) -> Iterator[Any]:
+    """decodes the items of a json-array response one at a time (a 100 item page never exists fully decoded)"""
+    text: str = resp.content.decode("utf-8")  # json is always utf-8 (and requests' charset detection is slow)
+    index: int = _skip_json_whitespace(text, 0)
+    if text[index:index + 1] != "[":
+        raise ValueError(f"expected a json array from {resp.url}")
+    index = _skip_json_whitespace(text, index + 1)
+    if text[index:index + 1] == "]":
+        return
+    while True:
+        item, index = _JSON_DECODER.raw_decode(text, index)
+        yield item
+        index = _skip_json_whitespace(text, index)
+        if text[index:index + 1] == "]":
             return
+        if text[index:index + 1] != ",":
+            raise ValueError(f"invalid json array from {resp.url} (at character {index})")
+        index = _skip_json_whitespace(text, index + 1)
+
+
+def _skip_json_whitespace(text: str, index: int) -> int:
+    while index < len(text) and text[index] in " \t\n\r":
+        index += 1
+    return index
+
+
+def _next_page_url(resp: requests.Response) -> Optional[str]:
+    try:
+        for link_str in resp.headers["Link"].split(", "):
+            url, rel = link_str.split("; rel=", 1)
+            if rel == '"next"':
+                return url[1:-1]  # cut < and >
+    except Exception:  # key error, not a string, etc -> does not contain next
+        pass
+    return None
 
 
 def main() -> None:
@@ -385,38 +2355,182 @@ def main() -> None:
         prog="github-repo-backuper",
         description="Back up a github repository",
     )
-    parser.add_argument("repo_owner", help="Name of the repository owner. Example: torvalds")
+    parser.add_argument("repo_owner", help="Name of the repository owner. Example: torvalds", nargs='?', default=None)
     parser.add_argument("repo_name", help="Name of the repository. Example: linux", nargs='?', default=None)
     parser.add_argument("--all-repos", action="store_true", help="Download all repos of the owner.")
     parser.add_argument("--include-forks", action="store_true", help="(for --all-repos)")
+    parser.add_argument("--skip-untouched", action="store_true", help="Skip repos without pushes or issue/PR activity since their last backup (for --all-repos).")
+    parser.add_argument("--repo-jobs", type=int, default=1, help="Number of repos to back up at once (for --all-repos). git and api work of different repos overlap.")
     parser.add_argument("--prune", action="store_true", help="Prune the git repository if this is a increment.")
     parser.add_argument("--detailed-prs", action="store_true", help="Store detailed PR information.")
     parser.add_argument("--include-lfs", action="store_true", help="Include git-lfs (requires git-lfs to be installed).")
     parser.add_argument("--include-releases", action="store_true", help="include github releases.")
     parser.add_argument("--include-wiki", action="store_true", help="include github wiki.")
     parser.add_argument("--include-projects", action="store_true", help="include github-repo projects (usually requires auth-token even if its public).")
-    parser.add_argument("--gzip", action="store_true", help="gzip files whereever possible to reduce filesize.")
-    parser.add_argument("--auth-token", type=str, help="GitHub auth token (note: classic tokens work with repos you dont own).")
+    parser.add_argument("--gzip", action="store_true", help="gzip files whereever possible to reduce filesize (same as --compress gzip).")
+    parser.add_argument("--compress", type=str, metavar="{none,gzip,zstd}[:LEVEL]", help="compress files whereever possible to reduce filesize (zstd requires the zstandard python package).")
+    parser.add_argument("--zstd-dictionary", action="store_true", help="train a zstd dictionary from the existing issues of a repo and use it for new issues (much smaller; readers need github/OWNER/REPO/zstd-dictionary.bin).")
+    parser.add_argument("--issue-storage", choices=["files", "packed"], default="files", help="Store issues as one file each or in packed segment-files (less files; a repo stays packed once it is).")
+    parser.add_argument("--search-index", action="store_true", help="Maintain a full-text index of all issues and PRs (github/.search-index.sqlite; existing backups get added on their next run).")
+    parser.add_argument("--search", type=str, metavar="QUERY", help="Search the search-index (optionally only within repo_owner / repo_name) instead of backing up. Supports sqlite fts5 syntax (AND, OR, \"phrases\", prefix*, title:word).")
+    parser.add_argument("--search-limit", type=int, default=20, help="Maximum number of --search results.")
+    parser.add_argument("--daemon", type=str, metavar="CONFIG", help="Keep the repos listed in a json config backed up (see BackupDaemon in the code for the format). The other arguments are the defaults for all repos.")
+    parser.add_argument("--daemon-submit", type=str, metavar="SOCKET", help="Queue a backup of repo_owner/repo_name (with the given include/compression/etc arguments) in a running --daemon instead of backing up.")
+    parser.add_argument("--read-issue", type=int, metavar="NUMBER", help="Print a backed up issue as json (works with every storage format) instead of backing up.")
+    parser.add_argument("--git-fetch-jobs", type=int, default=1, help="Number of parallel git fetches / pack threads.")
+    parser.add_argument("--git-filter", type=str, metavar="SPEC", help="Partial clone filter for new mirrors (example: blob:limit=10m). Filtered objects are NOT backed up.")
+    parser.add_argument("--git-maintenance-days", type=float, metavar="DAYS", help="Repack git mirrors (with bitmaps) and write commit-graphs if the last maintenance is older than DAYS (0 = every run).")
+    parser.add_argument("--git-bundles", action="store_true", help="Write a incremental git bundle (only new objects) into git-bundles/ after every backup that changed something.")
+    parser.add_argument("--auth-token", type=str, action="append", help="GitHub auth token (note: classic tokens work with repos you dont own). Can be specified multiple times to rotate between tokens.")
     parser.add_argument("--reserve-rate-limit", type=int, help="Reserve some rate-limit space for other programs and pause when only X requests remain.", default=0)
+    parser.add_argument("--pace-rate-limit", action="store_true", help="Spread the remaining rate-limit evenly until its reset instead of using it up and waiting.")
+    parser.add_argument("--jobs", type=int, help="Number of issues to fetch comments and PR-details for in parallel.", default=1)
+    parser.add_argument("--asset-jobs", type=int, default=1, help="Number of release assets to download at once.")
+    parser.add_argument("--dedup-assets", action="store_true", help="Store identical release assets (across all repos and forks) only once (in github/.blobs) and skip downloading known ones.")
+    parser.add_argument("--bulk-comments", action="store_true", help="Download all comments of the repo at once instead of one request per issue (much fewer requests; uses more memory on initial backups).")
+    parser.add_argument("--api", choices=["rest", "graphql"], default="rest", help="API used for issues and PRs (graphql needs far fewer requests, but requires --auth-token).")
+    parser.add_argument("--stats-json", type=str, metavar="FILE", help="Write per repo and phase statistics (time, requests, rate-limit usage, bytes, files) of the run as json.")
+    parser.add_argument("--prometheus-textfile", type=str, metavar="FILE", help="Write the statistics in the prometheus textfile-collector format (example: /var/lib/node_exporter/ghrb.prom).")
+    parser.add_argument("--http-cache", action="store_true", help="Cache release, project, and repo lists and only re-download them if they changed (unchanged responses do not count against the rate-limit).")
+    parser.add_argument("--http-pool-size", type=int, help="Number of kept-alive connections per host (should be at least --jobs).", default=10)
+    parser.add_argument("--http-retries", type=int, help="Retry failed requests (5xx, connection resets, etc) X times with exponential backoff.", default=3)
     args = parser.parse_args()
-    kwargs = args._get_kwargs()
+    # --search-index is passed on as a shared SearchIndex (see below)
+    kwargs = [(k, v) for k, v in args._get_kwargs() if k != "search_index"]
+    # only the explicitly specified ones -> the daemons defaults apply to the rest
+    job_options: Dict[str, Any] = {k: v for k, v in kwargs if k in DAEMON_JOB_OPTIONS and v != parser.get_default(k)}
+    if args.compress:
+        try:
+            Compression(args.compress)
+        except (ValueError, RuntimeError) as e:
+            parser.error(str(e))
     del parser
+    if args.read_issue is not None or args.search is not None:
+        logger.setLevel(logging.WARNING)  # logs go to stdout -> would break the output
     logger.debug("arguments: " + "; ".join({f"{k}: {v}" for k, v in kwargs}))
-    if not args.all_repos and not args.repo_name:
+    configure_http_session(pool_size=max(args.http_pool_size, max(args.jobs, args.asset_jobs) * max(args.repo_jobs, 1), 1), retries=max(args.http_retries, 0))
+    if args.search is not None:
+        _search(args.search, args.repo_owner, args.repo_name, args.search_limit)
+        return
+    if args.daemon_submit is not None:
+        if not args.repo_owner or not args.repo_name:
+            print("--daemon-submit requires repo_owner and repo_name")
+            exit(1)
+        try:
+            print(f"{args.repo_owner}/{args.repo_name}: {daemon_submit(args.daemon_submit, args.repo_owner, args.repo_name, job_options)}")
+        except (OSError, ValueError) as e:
+            print(f"submitting to the daemon failed: {e}")
+            exit(1)
+        return
+    if args.repo_owner is None and args.daemon is None:
+        print("repo_owner is required")
+        return
+    if not args.all_repos and not args.repo_name and args.daemon is None:
         print("either specify --all-repos or a repo_name")
         return
+    if args.read_issue is not None:
+        print(json.dumps(GithubRepoBackuper(**{k: v for k, v in kwargs}).read_issue(args.read_issue)))
+        return
+    # shared by all repos -> one exhausted token does not stall the whole run
+    governor = RateLimitGovernor(args.auth_token, reserve_rate_limit=max(args.reserve_rate_limit or 0, 0), pace=args.pace_rate_limit)
+    response_cache: Optional[ResponseCache] = ResponseCache(path.join("github", ".http-cache")) if args.http_cache else None
+    git_strategy = GitStrategy(
+        fetch_jobs=args.git_fetch_jobs,
+        filter=args.git_filter,
+        maintenance_days=args.git_maintenance_days,
+        bundles=args.git_bundles,
+    )
+    run_stats = RunStats()
+    if args.search_index:
+        makedirs("github", exist_ok=True)
+        kwargs.append(("search_index", SearchIndex(path.join("github", ".search-index.sqlite"))))
+
+    def write_stats() -> None:
+        if args.stats_json:
+            run_stats.write_json(args.stats_json)
+        if args.prometheus_textfile:
+            run_stats.write_prometheus(args.prometheus_textfile)
+
+    try:
+        if args.daemon is not None:
+            BackupDaemon(
+                args.daemon,
+                {
+                    **{k: v for k, v in kwargs if k not in ("repo_owner", "repo_name")},
+                    "governor": governor,
+                    "response_cache": response_cache,
+                    "git_strategy": git_strategy,
+                    "run_stats": run_stats,
+                },
+                governor=governor,
+                run_stats=run_stats,
+                repo_jobs=args.repo_jobs,
+                on_backup_done=write_stats,
+            ).run()
+        else:
+            _backup(args, kwargs, governor, response_cache, git_strategy, run_stats)
+    finally:
+        write_stats()
+
+
+def _search(query: str, repo_owner: Optional[str], repo_name: Optional[str], limit: int) -> None:
+    db_file: str = path.join("github", ".search-index.sqlite")
+    if not path.exists(db_file):
+        print("there is no search-index yet (create it by backing up with --search-index)")
+        exit(1)
+    repo: Optional[str] = None if repo_owner is None else f"{repo_owner}/{repo_name or ''}"
+    start: float = time()
+    hits: List[Dict[str, Any]] = SearchIndex(db_file).search(query, repo=repo, limit=limit)
+    for hit in hits:
+        print(f"{hit['repo']}#{hit['number']} [{'pr' if hit['is_pull_request'] else 'issue'}, {hit['state']}] {hit['title']}")
+        print(f"    {' '.join(hit['snippet'].split())}")
+    print(f"{len(hits)} results in {int((time() - start) * 1000)}ms")
+
+
+def _backup(
+    args: argparse.Namespace,
+    kwargs: List[Tuple[str, Any]],
+    governor: RateLimitGovernor,
+    response_cache: Optional[ResponseCache],
+    git_strategy: GitStrategy,
+    run_stats: RunStats,
+) -> None:
     if not args.all_repos:
-        GithubRepoBackuper(**{k: v for k, v in kwargs}).start_backup()
+        GithubRepoBackuper(**{k: v for k, v in kwargs}, governor=governor, response_cache=response_cache, git_strategy=git_strategy, run_stats=run_stats).start_backup()
         return
-    resp = _gh_get(f"https://api.github.com/users/{args.repo_owner}/repos", headers=GITHUB_HEADERS, reserve_rate_limit=max(args.reserve_rate_limit or 0, 0))
-    resp.raise_for_status()
-    logger.info(f"Found {len(resp_json := resp.json())} repositories in {args.repo_owner}")
-    for repo in resp_json:
+    with run_stats.measure(args.repo_owner, "list"):
+        repos: List[Dict[str, Any]] = list(_gh_paginated(f"https://api.github.com/users/{args.repo_owner}/repos?per_page=100", governor=governor, cache=response_cache))
+    logger.info(f"Found {len(repos)} repositories in {args.repo_owner}")
+    _write_owner_manifest(args.repo_owner, repos)
+    scheduler: Optional[BackupScheduler] = BackupScheduler(args.repo_jobs) if args.repo_jobs > 1 else None
+    for repo in repos:
         if repo["fork"] == True and not args.include_forks:
             logger.info(f"Skipped {repo['name']} since its a fork")
             continue
+        with run_stats.measure(args.repo_owner, "list"):
+            activity: str = _repo_activity(args.repo_owner, repo, governor) if args.skip_untouched else "all"
+        if activity == "none":
+            logger.info(f"Skipped {repo['name']} since it did not change since the last backup")
+            continue
         logger.info(f"Starting work on {repo['name']}")
-        GithubRepoBackuper(repo_name=repo["name"], **{k: v for k, v in kwargs if k != "repo_name"}).start_backup()
+        backuper = GithubRepoBackuper(
+            repo_name=repo["name"],
+            **{k: v for k, v in kwargs if k != "repo_name"},
+            governor=governor,
+            response_cache=response_cache,
+            skip_code=activity == "issues",
+            git_strategy=git_strategy,
+            run_stats=run_stats,
+        )
+        if scheduler is not None:
+            scheduler.submit(backuper)
+        else:
+            backuper.start_backup()
+    failed: Dict[str, BaseException] = scheduler.wait() if scheduler is not None else {}
+    _write_owner_manifest(args.repo_owner, repos)  # with the new last_backup dates
+    if failed:
+        logger.error(f"{len(failed)} backups failed: {', '.join(failed)}")
+        exit(1)
 
 
 if __name__ == "__main__":
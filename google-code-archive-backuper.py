@@ -3,13 +3,45 @@ import requests
 import json
 import gzip
 import subprocess
-from os import path, makedirs, listdir, unlink,chdir
-from typing import Any, List
+from os import path, makedirs, unlink
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from tempfile import TemporaryDirectory
-from copy import deepcopy
 from zipfile import ZipFile
 from shutil import move
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+_http_session: Optional[requests.Session] = None
+
+
+def configure_http_session(pool_size: int = 10, retries: int = 3, backoff: float = 1.0) -> requests.Session:
+    """keep-alive connection pool (+ retries for 5xx and connection resets) shared by all requests"""
+    global _http_session
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    _http_session = session
+    return session
+
+
+def _get_http_session() -> requests.Session:
+    if _http_session is None:
+        return configure_http_session()
+    return _http_session
 
 
 def _format_url(
@@ -25,78 +57,117 @@ def archive(
     project_name: str,
     domain: str = "code.google.com",
     do_gzip: bool = True,
+    jobs: int = 8,
+    max_misses: int = 20,
 ) -> None:
     '''
     Note: it gets converted into a github-similar format
 
     if you want to archive <https://code.google.com/archive/p/earthsurfer/> call archive("earthsurfer")
     the "domain" argument can be "code.google.com", "eclipselabs.org", or "apache-extras.org"
+    jobs: issues fetched at once
+    max_misses: the issue scan stops after this many consecutive missing issue ids (deleted issues leave gaps)
     '''
     base_path: str = path.join(".", "google-code", domain, project_name)
     makedirs(base_path, exist_ok=True)
     base_path = path.abspath(base_path)
 
-    response: requests.Response = requests.get(_format_url(domain=domain, project=project_name, file="project.json"))
+    response: requests.Response = _get_http_session().get(_format_url(domain=domain, project=project_name, file="project.json"))
     response.raise_for_status()
     project_meta = response.json()
     _write_gzipable_json(path.join(base_path, "original_project.json"), project_meta, do_gzip=do_gzip)
 
-    issue_id: int = 1
     makedirs(path.join(base_path, "issues"), exist_ok=True)
-    while True:
-        response = requests.get(_format_url(domain=domain, project=project_name, file=f"issues/issue-{issue_id}.json"))
-        if response.status_code != 200:
-            break
-        issue = response.json()
-        _write_gzipable_json(
-            path.join(base_path, "issues", f"{issue['id']}.json"),
-            {
-                "title": issue["summary"],
-                "state": {
-                    "new": "open",
-                    "accepted": "closed",
-                }[issue["status"].lower()],
-                "labels": issue["labels"],
-                "reactions": {"+1": issue["stars"]},
-                "comments": [{
-                    "user": comment["commenterId"],  # TODO: figure out how to get name (especially since this id is project specific (wtf google))
-                    "body": comment["content"],
-                    "created_at": datetime.fromtimestamp(comment["timestamp"]).strftime('%Y-%m-%dT%H:%M:%SZ'),  # dont ask me weather `timestamp` is creation or edit date..
-                } for comment in issue["comments"]],
-            },
-            do_gzip=do_gzip,
-        )
-        issue_id += 1
-    del issue_id
+    _download_issues(base_path, project_name, domain, do_gzip, jobs=jobs, max_misses=max_misses)
 
     # the git clone is completely borked and in general 90% dosnt work.
     # this source-code (+ sometimes history) is the only working method i found (except for svndump, which only works with svn repos)
 
-    with TemporaryDirectory() as tmpdir:
-        zip_file = path.join(tmpdir, "source.zip")
+    _import_source(base_path, project_name, domain)
+
+    # WIKIs dont even work on the website https://code.google.com/archive/p/earthsurfer/wikis
+
+    # DOWNLOADs dont even work on the website https://code.google.com/archive/p/earthsurfer/downloads
+
+
+def _import_source(base_path: str, project_name: str, domain: str) -> None:
+    """
+    if the source-archive contains a git repo only its .git gets extracted (and mirror-cloned), otherwise the zip is kept as is.
+    works without changing the cwd -> multiple projects can be archived in parallel.
+    """
+    # inside base_path -> the final move is a rename instead of a copy
+    with TemporaryDirectory(prefix=".source-import-", dir=base_path) as tmpdir:
+        zip_file: str = path.join(tmpdir, "source.zip")
         _download_file(
             _format_url(bucket="google-code-archive-source", domain=domain, project=project_name, file="source-archive.zip"),
             zip_file,
             gzip_result=False,
         )
-        start_dir: str = deepcopy(str(path.curdir))
-        chdir(tmpdir)  # "zf.extractall" "pwd" argument does not work (thanks python)
         with ZipFile(zip_file, "r") as zf:
-            zf.extractall()
-        chdir(start_dir)
-        subdir_name: str = [i for i in listdir(tmpdir) if i != "source.zip"][0]
-        if path.isdir(gitdir := path.join(tmpdir, subdir_name, ".git")):
-            subprocess.run(
-                ["git", "clone", "--mirror", gitdir, "git"],
-                cwd=base_path,
-            )
-        else:
+            # the archive contains a single directory (PROJECT/...) -> a git repo is PROJECT/.git/
+            git_members: List[str] = [name for name in zf.namelist() if name.split("/")[1:2] == [".git"]]
+            if git_members:
+                zf.extractall(path.join(tmpdir, "extracted"), members=git_members)
+        if not git_members:
             move(zip_file, path.join(base_path, "google-code-archive-source.zip"))
-                
+            return
+        gitdir: str = path.join(tmpdir, "extracted", git_members[0].split("/")[0], ".git")
+        subprocess.run(
+            ["git", "clone", "--mirror", gitdir, "git"],
+            cwd=base_path,
+        )
 
-    # WIKIs dont even work on the website https://code.google.com/archive/p/earthsurfer/wikis
 
-    # DOWNLOADs dont even work on the website https://code.google.com/archive/p/earthsurfer/downloads
+def _download_issues(base_path: str, project_name: str, domain: str, do_gzip: bool, jobs: int, max_misses: int) -> None:
+    """
+    a sliding window of issue ids gets fetched in parallel (issues are written as they arrive).
+    the window always reaches max_misses ids past the highest existing issue -> the scan ends after max_misses misses in a row.
+    """
+    jobs = max(jobs, 1)
+    highest_found: int = 0
+    next_id: int = 1
+    in_flight: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            while len(in_flight) < jobs and next_id <= highest_found + max_misses:
+                in_flight[executor.submit(_get_issue, project_name, domain, next_id)] = next_id
+                next_id += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                issue_id: int = in_flight.pop(future)
+                issue: Optional[Dict[str, Any]] = future.result()
+                if issue is None:
+                    continue
+                highest_found = max(highest_found, issue_id)
+                _write_gzipable_json(path.join(base_path, "issues", f"{issue['id']}.json"), _convert_issue(issue), do_gzip=do_gzip)
+
+
+def _get_issue(project_name: str, domain: str, issue_id: int) -> Optional[Dict[str, Any]]:
+    """None if the issue does not exist"""
+    response: requests.Response = _get_http_session().get(_format_url(domain=domain, project=project_name, file=f"issues/issue-{issue_id}.json"))
+    if response.status_code in (403, 404):  # the bucket answers 403 for missing files
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def _convert_issue(issue: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "title": issue["summary"],
+        "state": {
+            "new": "open",
+            "accepted": "closed",
+        }[issue["status"].lower()],
+        "labels": issue["labels"],
+        "reactions": {"+1": issue["stars"]},
+        "comments": [{
+            "user": comment["commenterId"],  # TODO: figure out how to get name (especially since this id is project specific (wtf google))
+            "body": comment["content"],
+            "created_at": datetime.fromtimestamp(comment["timestamp"]).strftime('%Y-%m-%dT%H:%M:%SZ'),  # dont ask me weather `timestamp` is creation or edit date..
+        } for comment in issue["comments"]],
+    }
 
 
 def _download_file(url: str, local_file: str, gzip_result: bool = False) -> None:
@@ -105,7 +176,7 @@ def _download_file(url: str, local_file: str, gzip_result: bool = False) -> None
         change the filename and check for duplicate compression at the other end.
     """
     # https://stackoverflow.com/a/16696317
-    with requests.get(url, stream=True) as r:
+    with _get_http_session().get(url, stream=True) as r:
         r.raise_for_status()  # TODO: handle
         if gzip_result:
             with gzip.open(local_file, "wb") as fp:
@@ -135,6 +206,9 @@ if __name__ == "__main__":
     )
     parser.add_argument("project_name", help="Name of the repository. Example: earthsurfer", type=str)
     parser.add_argument("--domain", type=str, default="code.google.com", help="Domain it was published under")
+    parser.add_argument("--jobs", type=int, default=8, help="Number of issues to fetch at once.")
+    parser.add_argument("--max-misses", type=int, default=20, help="Stop looking for issues after this many missing issue ids in a row.")
     args = parser.parse_args()
-    archive(project_name=args.project_name, domain=args.domain, do_gzip=True)
+    configure_http_session(pool_size=max(args.jobs, 10))
+    archive(project_name=args.project_name, domain=args.domain, do_gzip=True, jobs=args.jobs, max_misses=args.max_misses)
     